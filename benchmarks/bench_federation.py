@@ -0,0 +1,256 @@
+"""
+End-to-end throughput of a local federation of the Python federates.
+
+Runs a fixed scenario, one simulated day of transmission_dummy (event
+driven), distribution2, ng1, ng2 and transportation2, each federate in its
+own process on a zmq broker created here. The federates' configs are their
+entries in multi_site_config.json with the core, broker and periods
+overridden for a local run (see common/federation.py). Each federate writes
+its per-grant timing (common/timing.py) to a scratch results directory;
+from those and the federates' resource usage the benchmark reports
+
+    throughput    simulated seconds per wall-clock second
+    grants/s      time grants of all federates per wall-clock second
+    messages/s    values published by all federates per wall-clock second
+    peak RSS      maximum resident set size of every federate process, as
+                  the federate records it (process.json, see
+                  common/timing.py)
+
+The best of --repeat runs is appended to a JSONL history file (by default
+results/bench_federation.jsonl) and compared with the best of the last
+--window entries of the same scenario on the same machine: the run
+counts as a regression, and the exit status is 1, if its throughput
+dropped or a federate's peak RSS grew by more than --threshold (default
+10%).
+
+Sample call: python benchmarks/bench_federation.py
+             python benchmarks/bench_federation.py --repeat 5 --threshold 0.05 --keep scratch/
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+import helics as h
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'common'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import federation
+from recorder import RESULTS_DIR
+from bench_kernels import environment
+
+
+SIM_TIME = 86400
+
+# (federate, script, extra arguments)
+SCENARIO = (
+    ('transmission', 'transmission/transmission_dummy.py', ['--event_driven']),
+    ('distribution2', 'distribution2/distribution.py', []),
+    ('ng1', 'ng1/SAInt_ng1.py', ['--end_time', str(SIM_TIME)]),
+    ('ng2', 'ng2/ng2_dummy.py', ['--end_time', str(SIM_TIME)]),
+    ('transportation2', 'transportation2/transportation2_dummy.py', ['--end_time', str(SIM_TIME)]),
+)
+
+
+def scenario_config(source, port):
+    """
+    The scenario's multi-federate config built from `source`
+    (multi_site_config.json, see common/federation.py): the federates'
+    entries on a zmq core connecting to the broker on `port`, with timing
+    switched on.
+    """
+    # The port goes in the address: a "brokerPort" integer fails to parse
+    #   in a federate that loaded scipy.sparse.linalg before helics
+    entries = federation.load_entries(source)
+    return [federation.federate_config(entries, name, 'zmq', f'tcp://127.0.0.1:{port}', timing={'enabled': True})
+            for name, _, _ in SCENARIO]
+
+
+def scenario_id(config):
+    """
+    Short hash of the scenario: the federates' configs, scripts and
+    arguments. Only runs of the same scenario are compared.
+    """
+    spec = json.dumps([config, [list(federate) for federate in SCENARIO]], sort_keys=True)
+    return hashlib.sha1(spec.encode()).hexdigest()[:12]
+
+
+def read_counts(path):
+    """
+    Grants, values read and published, and wait (s) of a timing.csv.
+    """
+    counts = {'grants': 0, 'reads': 0, 'publishes': 0, 'wait': 0.0}
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            counts['grants'] += 1
+            counts['reads'] += int(row['reads'])
+            counts['publishes'] += int(row['publishes'])
+            counts['wait'] += float(row['wait'])
+    return counts
+
+
+def run_once(config_path, run_dir, port, timeout=300):
+    """
+    Runs the scenario once with the federates writing to `run_dir`.
+
+    :return: dict of the run's totals, with one dict per federate under
+        "federates"
+    """
+    broker = h.helicsCreateBroker('zmq', 'bench_broker', f'-f {len(SCENARIO)} --port={port} --loglevel=error')
+    if not h.helicsBrokerIsConnected(broker):
+        raise RuntimeError(f'broker on port {port} failed to connect')
+    env = dict(os.environ, RESULTS_DIR=run_dir)
+    procs = {}
+    start = time.perf_counter()
+    for name, script, extra in SCENARIO:
+        script = os.path.join(ROOT_DIR, script)
+        with open(os.path.join(run_dir, name + '.out'), 'w') as out:
+            procs[name] = subprocess.Popen([sys.executable, script, '--config', config_path] + extra,
+                                           cwd=os.path.dirname(script), env=env, stdout=out, stderr=subprocess.STDOUT)
+
+    # os.wait4 gives every federate's CPU time; its ru_maxrss is no use for
+    #   the peak RSS, which starts from the benchmark's own RSS at fork on
+    #   Linux, so the federates record their VmHWM themselves on close
+    federates = {}
+    try:
+        while len(federates) < len(procs):
+            for name, proc in procs.items():
+                if name in federates:
+                    continue
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    proc.returncode = os.waitstatus_to_exitcode(status)
+                    if proc.returncode != 0:
+                        raise RuntimeError(f'federate {name} failed, see {os.path.join(run_dir, name + ".out")}')
+                    federates[name] = {'wall': time.perf_counter() - start, 'cpu': usage.ru_utime + usage.ru_stime}
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f'federation did not finish within {timeout} s')
+            time.sleep(0.01)
+    finally:
+        for proc in procs.values():
+            if proc.returncode is None:
+                proc.kill()
+                proc.wait()
+        h.helicsBrokerWaitForDisconnect(broker, 5000)
+        h.helicsBrokerFree(broker)
+    wall = max(fed['wall'] for fed in federates.values())
+
+    for name, fed in federates.items():
+        fed.update(read_counts(os.path.join(run_dir, name, 'timing.csv')))
+        with open(os.path.join(run_dir, name, 'process.json'), 'r') as f:
+            fed['peak_rss_mb'] = json.load(f)['peak_rss_mb']
+    grants = sum(fed['grants'] for fed in federates.values())
+    publishes = sum(fed['publishes'] for fed in federates.values())
+    return {'wall': wall, 'throughput': SIM_TIME / wall, 'grants_per_s': grants / wall,
+            'messages_per_s': publishes / wall, 'grants': grants, 'messages': publishes, 'federates': federates}
+
+
+def baseline_of(history, scenario, machine, window):
+    """
+    Best throughput and lowest peak RSS per federate over the last
+    `window` history entries of `scenario` on `machine`; None if there
+    are none.
+    """
+    entries = [e for e in history if e['scenario'] == scenario and e['machine'] == machine][-window:]
+    if not entries:
+        return None
+    rss = {}
+    for entry in entries:
+        for name, fed in entry['federates'].items():
+            if fed['peak_rss_mb'] is not None:
+                rss[name] = min(rss.get(name, fed['peak_rss_mb']), fed['peak_rss_mb'])
+    return {'runs': len(entries), 'throughput': max(e['throughput'] for e in entries), 'peak_rss_mb': rss}
+
+
+def check(result, baseline, threshold):
+    """
+    Prints `result` against `baseline` and returns the regressions found.
+    """
+    regressions = []
+    ratio = result['throughput'] / baseline['throughput']
+    print('\nthroughput %.1f vs best %.1f of the last %d runs: %.2fx'
+          % (result['throughput'], baseline['throughput'], baseline['runs'], ratio))
+    if ratio < 1 - threshold:
+        regressions.append('throughput %.1f < %.1f' % (result['throughput'], baseline['throughput']))
+    for name, fed in result['federates'].items():
+        base = baseline['peak_rss_mb'].get(name)
+        if base and fed['peak_rss_mb'] is not None and fed['peak_rss_mb'] > base * (1 + threshold):
+            regressions.append('%s peak RSS %.1f MB > %.1f MB' % (name, fed['peak_rss_mb'], base))
+    return regressions
+
+
+def report(result):
+    print('\n%-18s %8s %8s %8s %10s %10s %10s' % ('federate', 'grants', 'reads', 'sent', 'wait (s)', 'cpu (s)', 'RSS (MB)'))
+    for name, fed in result['federates'].items():
+        rss = '-' if fed['peak_rss_mb'] is None else '%.1f' % fed['peak_rss_mb']
+        print('%-18s %8d %8d %8d %10.3f %10.3f %10s' % (name, fed['grants'], fed['reads'], fed['publishes'],
+                                                        fed['wait'], fed['cpu'], rss))
+    print('\n%d simulated s in %.3f s: throughput %.1f sim s/s, %.1f grants/s, %.1f messages/s'
+          % (SIM_TIME, result['wall'], result['throughput'], result['grants_per_s'], result['messages_per_s']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', help='multi-federate config the scenario is built from',
+                        default=os.path.join(ROOT_DIR, 'multi_site_config.json'))
+    parser.add_argument('-r', '--repeat', help='runs of the scenario; the fastest is recorded', default=3, type=int)
+    parser.add_argument('-p', '--port', help='port of the benchmark broker', default=23500, type=int)
+    parser.add_argument('-H', '--history', help='JSONL history file', default=os.path.join(RESULTS_DIR, 'bench_federation.jsonl'))
+    parser.add_argument('-t', '--threshold', help='relative throughput drop or peak RSS growth counted as a regression', default=0.10, type=float)
+    parser.add_argument('-w', '--window', help='number of previous runs the baseline is taken from', default=5, type=int)
+    parser.add_argument('--timeout', help='seconds a run may take', default=300, type=float)
+    parser.add_argument('--keep', help='keep the federates\' output in this directory', default=None)
+    parser.add_argument('--no-save', help='do not append the result to the history', action='store_true')
+    args = parser.parse_args()
+
+    config = scenario_config(args.config, args.port)
+    scenario = scenario_id(config)
+    scratch = tempfile.mkdtemp(prefix='bench_federation_')
+    config_path = os.path.join(scratch, 'scenario_config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=1)
+
+    results = []
+    try:
+        for k in range(args.repeat):
+            run_dir = os.path.join(scratch, 'run%d' % k)
+            os.makedirs(run_dir)
+            results.append(run_once(config_path, run_dir, args.port, args.timeout))
+            print('run %d: %.3f s, throughput %.1f sim s/s' % (k + 1, results[-1]['wall'], results[-1]['throughput']))
+    finally:
+        h.helicsCloseLibrary()
+        if args.keep:
+            shutil.copytree(scratch, args.keep, dirs_exist_ok=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    result = max(results, key=lambda r: r['throughput'])
+    report(result)
+
+    env = environment()
+    entry = dict(result, scenario=scenario, machine='%s/%s cpus' % (env['platform'], env['cpus']),
+                 environment=env, runs=[r['throughput'] for r in results])
+    history = []
+    if os.path.isfile(args.history):
+        with open(args.history, 'r') as f:
+            history = [json.loads(line) for line in f if line.strip()]
+    baseline = baseline_of(history, scenario, entry['machine'], args.window)
+    regressions = check(result, baseline, args.threshold) if baseline else []
+    if baseline is None:
+        print('\nNo earlier runs of scenario %s in %s to compare with' % (scenario, args.history))
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    if regressions:
+        print('\nRegressions beyond %.0f%%:\n  %s' % (100 * args.threshold, '\n  '.join(regressions)))
+        raise SystemExit(1)
@@ -0,0 +1,309 @@
+"""
+Microbenchmarks of the federates' compute kernels, run without a broker.
+
+Every benchmark times one call of a kernel (a feeder solve, a heat-rate
+Newton step, a bid encoding, ...) on fixed inputs: the number of calls per
+round is calibrated to take at least --min-time seconds, and the per-call
+times of --rounds rounds are summarized (min, median, mean, stdev). The
+results, with the Python/NumPy versions, platform and git commit, can be
+written as JSON and compared against a stored baseline:
+
+    python benchmarks/bench_kernels.py -o baseline.json
+    ... change something ...
+    python benchmarks/bench_kernels.py --compare baseline.json
+
+--compare prints the ratio of the per-call times per benchmark and exits
+with status 1 if any benchmark got slower than --threshold (default 10%),
+so it can gate a change. It compares the fastest round by default, which
+is the least disturbed by other load on the machine; --stat median
+compares the medians instead. -k runs only the benchmarks whose name
+contains one of the given strings.
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import subprocess
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for subdir in ('common', 'distribution2', 'distribution3', 'ng1', 'transmission'):
+    sys.path.append(os.path.join(ROOT_DIR, subdir))
+
+import bidcodec
+import heat_rate
+import distribution
+from distribution import Distribution, DistributionBatch, RadialFeeder, Line, LineLibrary, Load, LoadBank
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Registers a setup function under `name`; it builds the inputs and
+    returns the zero-argument callable to time.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+######## distribution2: feeder models ########
+
+@benchmark('distribution.Distribution.step')
+def _():
+    dist = Distribution()
+    v = distribution.cplx(12470, 0), distribution.cplx(12470, 120), distribution.cplx(12470, 240)
+    dist.step(*v, hour=1, iter=0)
+    return lambda: dist.step(*v, hour=1, iter=1)
+
+
+@benchmark('distribution.Distribution.solve')
+def _():
+    dist = Distribution()
+    v = distribution.cplx(12470, 0), distribution.cplx(12470, 120), distribution.cplx(12470, 240)
+    return lambda: dist.solve(*v, hour=1, warm_start=False)
+
+
+for _n in (10, 100, 1000):
+    @benchmark(f'distribution.DistributionBatch.solve[{_n} feeders]')
+    def _(n=_n):
+        batch = DistributionBatch.replicate(n)
+        v = batch.nominal_voltage()[0]
+        return lambda: batch.solve(v, hour=1, warm_start=False)
+
+
+for _n in (10, 100, 1000):
+    @benchmark(f'distribution.RadialFeeder.solve[{_n} nodes]')
+    def _(n=_n):
+        feeder = RadialFeeder.synthetic(n)
+        v = distribution.cplx(12470, 0), distribution.cplx(12470, 120), distribution.cplx(12470, 240)
+        return lambda: feeder.solve(*v, hour=1, warm_start=False)
+
+
+@benchmark('distribution.Line[cached]')
+def _():
+    library = LineLibrary()
+    Line('2/0_acsr', '1/0_acsr', 1.0, library=library)
+    return lambda: Line('2/0_acsr', '1/0_acsr', 1.0, library=library)
+
+
+@benchmark('distribution.Line[uncached]')
+def _():
+    return lambda: Line('2/0_acsr', '1/0_acsr', 1.0, library=LineLibrary())
+
+
+@benchmark('distribution.Load.power')
+def _():
+    load = Load(10e6, 5e6, 0.333, 0.333, 0.333, 0.333, 0.333, 0.333)
+    return lambda: load.power(12000.0, 1)
+
+
+@benchmark('distribution.LoadBank.power[1000 loads]')
+def _():
+    bank = LoadBank.from_loads(Load(10e6, 5e6, 0.333, 0.333, 0.333, 0.333, 0.333, 0.333) for _ in range(1000))
+    v = np.full(1000, 12000.0)
+    return lambda: bank.power(v, 1)
+
+
+######## ng1: gas generator heat rates ########
+
+def _generators(n, table=False):
+    return heat_rate.GasGenerators({
+        'generators': [{'node': k, 'HR': [20, -0.075, 0.001], 'QMin': 0, 'QMax': 30, 'PMax': 100} for k in range(n)],
+        'inverse_table': {'enabled': table},
+    })
+
+
+for _n in (2, 1000):
+    @benchmark(f'ng1.CalcPthermal[{_n} generators]')
+    def _(n=_n):
+        gens = _generators(n)
+        P = np.random.default_rng(0).uniform(0, 100, n)
+        return lambda: heat_rate.CalcPthermal(P, gens.HR)
+
+    @benchmark(f'ng1.CalculatePMW[{_n} generators]')
+    def _(n=_n):
+        gens = _generators(n)
+        P = np.random.default_rng(0).uniform(0, 100, n)
+        Q = heat_rate.CheckQLimit(gens.gas_offtake(P), gens.QMin, gens.QMax)
+        return lambda: gens.available_power(P, Q)
+
+    @benchmark(f'ng1.CalculatePMW[{_n} generators, inverse table]')
+    def _(n=_n):
+        gens = _generators(n, table=True)
+        P = np.random.default_rng(0).uniform(0, 100, n)
+        Q = heat_rate.CheckQLimit(gens.gas_offtake(P), gens.QMin, gens.QMax)
+        return lambda: gens.available_power(P, Q)
+
+
+######## distribution3: DSO bids ########
+
+def _bids(n_buses, blocks=10):
+    rng = np.random.default_rng(0)
+    constant_kW = 12 + 2 * rng.random(n_buses)
+    P_bid = np.linspace(30, 10, blocks)
+    Q_bid = np.outer(constant_kW * 0.2, np.linspace(0, 1, blocks))
+    return constant_kW, constant_kW * 0.2, P_bid, Q_bid
+
+
+for _encoding in bidcodec.ENCODINGS:
+    @benchmark(f'dso.bids.encode_many[24 buses, {_encoding}]')
+    def _(encoding=_encoding):
+        bids = _bids(24)
+        return lambda: bidcodec.encode_many(*bids, encoding=encoding)
+
+    @benchmark(f'dso.bids.decode[{_encoding}]')
+    def _(encoding=_encoding):
+        raw = bidcodec.encode_many(*_bids(1), encoding=encoding)[0]
+        return lambda: bidcodec.decode(raw)
+
+
+@benchmark('dso.BidGenerator.generate[24 buses]')
+def _():
+    import demo_DSO
+    generator = demo_DSO.BidGenerator(24, np.random.default_rng(0))
+    cleared_price = np.full(24, 100.0)
+    return lambda: generator.generate(cleared_price)
+
+
+######## transmission: per-subscription updates ########
+
+for _n in (10, 1000):
+    @benchmark(f'transmission.update_voltages[{_n} buses]')
+    def _(n=_n):
+        import transmission_dummy
+        # The registry's arrays without a federate behind them
+        registry = transmission_dummy.InterfaceRegistry.__new__(transmission_dummy.InterfaceRegistry)
+        registry.nominal_load = np.full(n, 30 + 15j)
+        registry.load_scaling = np.ones(n)
+        registry.voltage_V = np.full(n, 133000 + 0j)
+        loads = registry.nominal_load.copy()
+        pos = np.arange(n)
+        return lambda: registry.update_voltages(loads, pos)
+
+
+@benchmark('transmission.bid_content_hash[binary]')
+def _():
+    raw = bidcodec.encode_many(*_bids(1))[0]
+    return lambda: bidcodec.content_hash(raw)
+
+
+######## Running and comparing ########
+
+def measure(func, rounds=7, min_time=0.2):
+    """
+    Per-call times (s) of `func` over `rounds` rounds of a calibrated
+    number of calls.
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    times = [t / number for t in timer.repeat(repeat=rounds, number=number)]
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'rounds': rounds,
+        'number': number,
+    }
+
+
+def environment():
+    """
+    What the numbers were measured on.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold, stat='min'):
+    """
+    Prints the ratios of statistic `stat` against `baseline` and returns
+    the names of the benchmarks that got slower than `threshold`.
+    """
+    regressions = []
+    print('\n%-56s %12s %12s %8s' % ('benchmark', 'baseline', 'now', 'ratio'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print('%-56s %12s %12s %8s' % (name, '-', format_time(result[stat]), 'new'))
+            continue
+        ratio = result[stat] / base[stat]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  slower'
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = '  faster'
+        print('%-56s %12s %12s %7.2fx%s' % (name, format_time(base[stat]), format_time(result[stat]), ratio, flag))
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%.3f %s' % (seconds / scale, unit)
+    return '%.1f ns' % (seconds / 1e-9)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-k', '--select', help='only run benchmarks whose name contains one of these strings', nargs='+', default=None)
+    parser.add_argument('-o', '--output', help='write the results to this JSON file', default=None)
+    parser.add_argument('-c', '--compare', help='baseline JSON file to compare against', default=None)
+    parser.add_argument('-t', '--threshold', help='relative slow-down counted as a regression', default=0.10, type=float)
+    parser.add_argument('-s', '--stat', help='statistic compared with the baseline', choices=('min', 'median', 'mean'), default='min')
+    parser.add_argument('-r', '--rounds', help='timed rounds per benchmark', default=7, type=int)
+    parser.add_argument('--min-time', help='minimum duration of a round in seconds', default=0.2, type=float)
+    parser.add_argument('-l', '--list', help='list the benchmarks and exit', action='store_true')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.select or any(s in name for s in args.select)]
+    if args.list:
+        print('\n'.join(names))
+        raise SystemExit(0)
+
+    results = {}
+    for name in names:
+        func = BENCHMARKS[name]()
+        results[name] = measure(func, rounds=args.rounds, min_time=args.min_time)
+        r = results[name]
+        print('%-56s %12s  (min %s, stdev %s, %d x %d calls)' % (name, format_time(r['median']), format_time(r['min']),
+                                                                 format_time(r['stdev']), r['rounds'], r['number']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'benchmarks': results}, f, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['benchmarks'], args.threshold, args.stat)
+        if regressions:
+            print('\n%d of %d benchmarks slower than the baseline by more than %.0f%%'
+                  % (len(regressions), len(results), 100 * args.threshold))
+            raise SystemExit(1)
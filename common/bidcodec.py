@@ -0,0 +1,138 @@
+"""
+Encoding of real-time energy bids exchanged between DSOs and the ISO.
+
+A bid is a dict
+
+    {"constant_kW": float, "constant_kVAR": float, "P_bid": [...], "Q_bid": [...]}
+
+with one price (P_bid, $/MWh) per flexible quantity block (Q_bid, kW).
+It travels either as JSON text or in the binary format below; `decode`
+accepts both, so receivers work with senders of either kind (e.g. the
+MATLAB transmission federate, which only speaks JSON).
+
+Binary format, version 1 (little-endian):
+
+    offset  size    field
+    0       4       magic b"MSBD"
+    4       1       version (1)
+    5       1       reserved, always 0
+    6       2       uint16 number of blocks n
+    8       4       uint32 CRC-32 of everything from offset 12 on
+    12      8       float64 constant_kW
+    20      8       float64 constant_kVAR
+    28      4n      float32 P_bid[n]
+    28+4n   4n      float32 Q_bid[n]
+
+The zero byte at offset 5 makes the message read as the text "MSBD\\x01"
+by string getters such as helicsInputGetString, which stop at the first
+NUL, so a receiver can recognize a binary bid from the string and only
+then fetch the full payload with helicsInputGetBytes.
+"""
+
+import json
+import zlib
+import struct
+
+import numpy as np
+
+
+MAGIC = b'MSBD'
+VERSION = 1
+HEADER = struct.Struct('<4sBxHI')
+CONSTANTS = struct.Struct('<dd')
+MAGIC_TEXT = (MAGIC + bytes([VERSION])).decode('ascii')
+ENCODINGS = ('binary', 'json')
+
+
+def encode(bid, encoding='binary'):
+    """
+    Encodes `bid` as bytes ("binary") or as a JSON string ("json").
+    """
+    if encoding == 'json':
+        return json.dumps({
+            'constant_kW': float(bid['constant_kW']),
+            'constant_kVAR': float(bid['constant_kVAR']),
+            'P_bid': [float(p) for p in bid['P_bid']],
+            'Q_bid': [float(q) for q in bid['Q_bid']],
+        })
+    if encoding != 'binary':
+        raise ValueError(f'unknown bid encoding "{encoding}", expected one of {ENCODINGS}')
+    P_bid = np.asarray(bid['P_bid'], dtype='<f4')
+    Q_bid = np.asarray(bid['Q_bid'], dtype='<f4')
+    if P_bid.shape != Q_bid.shape or P_bid.ndim != 1:
+        raise ValueError(f'P_bid and Q_bid must be 1-D and of equal length, got {P_bid.shape} and {Q_bid.shape}')
+    body = CONSTANTS.pack(bid['constant_kW'], bid['constant_kVAR']) + P_bid.tobytes() + Q_bid.tobytes()
+    return HEADER.pack(MAGIC, VERSION, len(P_bid), zlib.crc32(body)) + body
+
+
+def encode_many(constant_kW, constant_kVAR, P_bid, Q_bid, encoding='binary'):
+    """
+    Encodes the bids of many buses at once: one message per entry of
+    `constant_kW`. `P_bid`/`Q_bid` are (n_buses, n_blocks) arrays, or a
+    single (n_blocks,) curve shared by all buses.
+    """
+    constant_kW = np.asarray(constant_kW, dtype=float)
+    n_buses = len(constant_kW)
+    constant_kVAR = np.broadcast_to(np.asarray(constant_kVAR, dtype=float), (n_buses,))
+    P_bid = np.atleast_2d(P_bid)
+    Q_bid = np.atleast_2d(Q_bid)
+    n = max(P_bid.shape[1], Q_bid.shape[1])
+    P_bid = np.broadcast_to(P_bid, (n_buses, n))
+    Q_bid = np.broadcast_to(Q_bid, (n_buses, n))
+    if encoding != 'binary':
+        return [encode({'constant_kW': kW, 'constant_kVAR': kVAR, 'P_bid': P, 'Q_bid': Q}, encoding)
+                for kW, kVAR, P, Q in zip(constant_kW, constant_kVAR, P_bid, Q_bid)]
+    body = np.empty(n_buses, dtype=[('kW', '<f8'), ('kVAR', '<f8'), ('P', '<f4', (n,)), ('Q', '<f4', (n,))])
+    body['kW'] = constant_kW
+    body['kVAR'] = constant_kVAR
+    body['P'] = P_bid
+    body['Q'] = Q_bid
+    size = body.dtype.itemsize
+    data = body.tobytes()
+    messages = []
+    for k in range(n_buses):
+        row = data[k * size:(k + 1) * size]
+        messages.append(HEADER.pack(MAGIC, VERSION, n, zlib.crc32(row)) + row)
+    return messages
+
+
+def is_binary(raw):
+    return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:4]) == MAGIC
+
+
+def decode(raw):
+    """
+    Decodes a binary or JSON bid (str or bytes) into a bid dict.
+    """
+    if not is_binary(raw):
+        if isinstance(raw, (bytes, bytearray, memoryview)):
+            raw = bytes(raw).decode('utf-8')
+        return json.loads(raw)
+    magic, version, n, crc = HEADER.unpack_from(raw)
+    if version != VERSION:
+        raise ValueError(f'unsupported binary bid version {version}')
+    expected = HEADER.size + CONSTANTS.size + 8 * n
+    if len(raw) != expected:
+        raise ValueError(f'binary bid of {n} blocks should be {expected} bytes, got {len(raw)}')
+    if zlib.crc32(memoryview(raw)[HEADER.size:]) != crc:
+        raise ValueError('binary bid failed its CRC check')
+    constant_kW, constant_kVAR = CONSTANTS.unpack_from(raw, HEADER.size)
+    blocks = np.frombuffer(raw, dtype='<f4', count=2 * n, offset=HEADER.size + CONSTANTS.size)
+    return {
+        'constant_kW': constant_kW,
+        'constant_kVAR': constant_kVAR,
+        'P_bid': blocks[:n].tolist(),
+        'Q_bid': blocks[n:].tolist(),
+    }
+
+
+def content_hash(raw):
+    """
+    Hash of an encoded bid for change detection. For binary bids this is
+    the CRC stored in the header, so nothing is decoded or re-hashed.
+    """
+    if is_binary(raw):
+        return HEADER.unpack_from(raw)[3]
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    return zlib.crc32(raw)
@@ -0,0 +1,124 @@
+"""
+Configs for running the Python federates together on one machine.
+
+The entries of multi_site_config.json describe the deployed federation,
+where several federates are stand-ins for other tools and every federate
+has its own host. Local runs (tools/run_inproc.py, benchmarks/
+bench_federation.py) start from the same entries and override what only
+makes sense across sites:
+
+    core type and broker   the local core ("inproc", "zmq") and broker
+    period                 the Python federates step on fixed periods
+    units                  dropped: the entries disagree (MMBtu against MW
+                           for gas), which HELICS refuses to connect
+    interface types        where a dummy exchanges other types than the
+                           federate it stands in for (INTERFACE_TYPES)
+    subscription keys      where an entry subscribes to a name the
+                           transmission dummy does not publish
+                           (INTERFACE_KEYS)
+
+Federates without an entry use their own config (FALLBACK_CONFIGS).
+
+    entries = federation.load_entries()
+    config = federation.federate_config(entries, 'ng2', 'inproc')
+
+unconnected() lists the subscriptions no federate of a run publishes.
+"""
+
+import os
+import copy
+import json
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(ROOT_DIR, 'multi_site_config.json')
+
+# Periods of the Python federates; distribution.py reads its period in hours
+PERIODS = {
+    'transmission': 300,
+    'distribution2': 1,
+    'distribution3': 1,
+    'ng1': 300,
+    'ng2': 300,
+    'transportation2': 300,
+}
+
+# Interface types of the dummies that differ from the federates they stand
+#   in for: distribution.py and demo_DSO.py exchange complex scalars where
+#   the feeder federates' entries use complex vectors
+INTERFACE_TYPES = {
+    'distribution2': 'complex',
+    'distribution3': 'complex',
+}
+
+# Subscription keys of the entries that differ from what the transmission
+#   dummy publishes: the feeder federates' entries subscribe to the bus
+#   voltage as pcc.N.v, the dummy publishes it as pcc.N.pnv
+INTERFACE_KEYS = {
+    'distribution2': {'transmission/pcc.9.v': 'transmission/pcc.9.pnv'},
+    'distribution3': {'transmission/pcc.13.v': 'transmission/pcc.13.pnv'},
+}
+
+# Configs of the federates that have no entry in multi_site_config.json
+FALLBACK_CONFIGS = {
+    'transportation2': 'transportation2/config_standalone.json',
+}
+
+# Keys that place a federate on a core or broker
+CORE_KEYS = ('coreType', 'core_type', 'coretype', 'coreName', 'broker_address', 'brokerAddress',
+             'coreInit', 'coreInitString')
+
+
+def load_entries(path=None):
+    """
+    Federate entries of a multi-federate config (by default
+    multi_site_config.json), keyed by name.
+    """
+    with open(path or DEFAULT_CONFIG, 'r') as f:
+        return {entry['name']: entry for entry in json.load(f)}
+
+
+def federate_config(entries, name, core_type, broker_address=None, timing=None):
+    """
+    Config of federate `name` for a local run: its entry in `entries` (or
+    its fallback config) on a `core_type` core, connecting to the broker at
+    `broker_address` if given, with its local period and interface types,
+    no units, its subscription keys mapped and the given "timing" block
+    (see common/timing.py).
+    """
+    if name in entries:
+        config = copy.deepcopy(entries[name])
+    elif name in FALLBACK_CONFIGS:
+        with open(os.path.join(ROOT_DIR, FALLBACK_CONFIGS[name]), 'r') as f:
+            config = json.load(f)
+    else:
+        raise KeyError(f'no config for federate {name}')
+    for key in CORE_KEYS:
+        config.pop(key, None)
+    for interface in config.get('publications', []) + config.get('subscriptions', []):
+        interface.pop('unit', None)
+        if name in INTERFACE_TYPES:
+            interface['type'] = INTERFACE_TYPES[name]
+    for interface in config.get('subscriptions', []):
+        interface['key'] = INTERFACE_KEYS.get(name, {}).get(interface['key'], interface['key'])
+    config.update({'name': name, 'core_type': core_type, 'log_level': 'warning'})
+    if broker_address:
+        config['broker_address'] = broker_address
+    if name in PERIODS:
+        config['period'] = PERIODS[name]
+    if timing is not None:
+        config['timing'] = timing
+    return config
+
+
+def unconnected(configs):
+    """
+    Subscription keys of every config in `configs` (the federates of one
+    run) that no publication of the run matches, keyed by federate name.
+    """
+    published = set()
+    for config in configs:
+        for pub in config.get('publications', []):
+            published.add(pub['key'] if pub.get('global', False) else f"{config['name']}/{pub['key']}")
+    return {config['name']: [sub['key'] for sub in config.get('subscriptions', []) if sub['key'] not in published]
+            for config in configs}
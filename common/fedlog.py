@@ -0,0 +1,178 @@
+"""
+Low-overhead logging shared by all federates.
+
+Records are handed to a queue and formatted/written by a background
+listener thread, so the federate's time loop only pays for building the
+LogRecord. Each federate gets a logger named after it, and optional
+subsystem loggers ("<federate>.<subsystem>") whose levels can be set
+independently in the federate's entry of multi_site_config.json:
+
+    "logging": {
+        "level": "info",
+        "file": "logs/transmission.log",
+        "subsystems": {"interfaces": "warning"}
+    }
+
+Values exchanged with the federation are logged as compact structured
+records with `value()`:
+
+    1666091912.123|D|transmission.interfaces|t=300.0|distribution2/pcc.9.pq=(29.1+16.2j)
+
+Use %-style arguments (logger.debug('x %s', x)) rather than f-strings so
+that suppressed messages are never formatted.
+"""
+
+import os
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CONFIG = os.path.join(ROOT_DIR, 'multi_site_config.json')
+
+# Argument types that are safe to format later on the listener thread
+_IMMUTABLE = (str, int, float, complex, bool, type(None), bytes)
+
+_listeners = {}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    One line per record: wall-clock time, level initial, logger name and,
+    for structured records, simulation time and interface=value.
+    """
+
+    def format(self, record):
+        parts = ['%.3f' % record.created, record.levelname[0], record.name]
+        if hasattr(record, 'sim_time'):
+            parts.append('t=%s' % record.sim_time)
+            parts.append('%s=%s' % (record.interface, record.value))
+        message = record.getMessage()
+        if message:
+            parts.append(message)
+        line = '|'.join(parts)
+        if record.exc_text:
+            line = line + '\n' + record.exc_text
+        return line
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+    Only records with mutable arguments (e.g. arrays that may be updated
+    in place) or exceptions are rendered before being queued.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not all(isinstance(a, _IMMUTABLE) for a in _args(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _args(args):
+    return args.values() if isinstance(args, dict) else args
+
+
+def _level(name, default=logging.INFO):
+    if name is None:
+        return default
+    if isinstance(name, int):
+        return name
+    return logging.getLevelName(str(name).upper())
+
+
+def load_federate_config(federate, config_path=None):
+    """
+    The federate's entry in multi_site_config.json (or a single-federate
+    JSON config); empty if there is none.
+    """
+    path = config_path or DEFAULT_CONFIG
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if isinstance(config, list):
+        config = next((entry for entry in config if entry.get('name') == federate), {})
+    return config
+
+
+def load_logging_config(federate, config_path=None):
+    """
+    The "logging" block of the federate's config; empty if there is none.
+    """
+    return load_federate_config(federate, config_path).get('logging', {})
+
+
+def setup(federate, config_path=None, log_file=None, level=None, console=True):
+    """
+    Configures the federate's logger with a queue-based background writer
+    and returns it. Calling it again for the same federate returns the
+    existing logger.
+
+    :param federate: federate name, used to find its logging config
+    :param config_path: config file to read; defaults to multi_site_config.json
+    :param log_file: log file, overriding the config's "file"
+    :param level: level, overriding the config's "level"
+    :param console: also write to stderr
+    """
+    logger = logging.getLogger(federate)
+    if federate in _listeners:
+        return logger
+
+    config = load_logging_config(federate, config_path)
+    logger.setLevel(_level(level or config.get('level')))
+    logger.propagate = False
+    for subsystem, sub_level in config.get('subsystems', {}).items():
+        logging.getLogger(f'{federate}.{subsystem}').setLevel(_level(sub_level))
+
+    formatter = StructuredFormatter()
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    log_file = log_file or config.get('file')
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, mode='w'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LazyQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[federate] = listener
+    return logger
+
+
+def get_logger(federate, subsystem=None):
+    if subsystem is None:
+        return logging.getLogger(federate)
+    return logging.getLogger(f'{federate}.{subsystem}')
+
+
+def value(logger, sim_time, interface, val, level=logging.DEBUG):
+    """
+    Emits a structured (sim time, interface, value) record; nothing is
+    built when the level is disabled.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, '', extra={'sim_time': sim_time, 'interface': interface, 'value': val})
+
+
+def shutdown():
+    """
+    Flushes and stops every background writer.
+    """
+    while _listeners:
+        _, listener = _listeners.popitem()
+        listener.stop()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,219 @@
+"""
+Columnar time-series recorder shared by all federates.
+
+Every recorded sample is a row of three columns, (sim time, interface id,
+value), kept in preallocated NumPy buffers and appended to one raw binary
+file per column whenever a chunk fills up. Memory use is flat however
+long the run is, and everything up to the last flushed chunk survives if
+the federate dies. A run directory looks like:
+
+    results/transmission/
+        meta.json      interface names/labels, column dtypes, plot specs
+        time.bin       float64 simulation time (s)
+        iface.bin      uint16 interface id (index into meta["interfaces"])
+        value.bin      float32 value (float64 with value_dtype='<f8')
+
+Typical use:
+
+    rec = Recorder(os.path.join(RESULTS_DIR, 'transmission'))
+    bus2 = rec.interface('transmission/pcc.2.pnv', 'Bus 2 voltage (V)')
+    ...
+    rec.record(bus2, granted_time, abs(voltage))
+    ...
+    rec.close()
+
+    t, v = Results(rec.path).series('transmission/pcc.2.pnv')
+
+Values that are not finite once stored (inf or nan inputs, or finite ones
+beyond the float32 range) are counted per interface in meta["nonfinite"]
+when a chunk is flushed, and reported through `logger` if one is given.
+"""
+
+import os
+import json
+import atexit
+
+import numpy as np
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Where federates write their results; RESULTS_DIR in the environment
+#   redirects a run elsewhere (e.g. a benchmark's scratch directory)
+RESULTS_DIR = os.environ.get('RESULTS_DIR') or os.path.join(ROOT_DIR, 'results')
+
+COLUMNS = (
+    ('time', np.dtype('<f8')),
+    ('iface', np.dtype('<u2')),
+    ('value', np.dtype('<f4')),
+)
+FORMAT_VERSION = 1
+
+
+class Recorder:
+    """
+    Appends (time, interface, value) samples to a run directory in chunks
+    of `chunk_size` rows. Extra entries put in `meta` (e.g. "plots") are
+    written to meta.json alongside the interface table. `value_dtype`
+    replaces float32 for quantities that can leave its range.
+    """
+
+    def __init__(self, path, chunk_size=65536, meta=None, value_dtype=None, logger=None):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.meta = dict(meta or {})
+        self.logger = logger
+        self.columns = tuple((name, np.dtype(value_dtype) if name == 'value' and value_dtype else dtype)
+                             for name, dtype in COLUMNS)
+        self.interfaces = []
+        self.labels = []
+        self.index = {}
+        self.nonfinite = {}
+        self.rows = 0
+        self.n = 0
+        self.buffers = {name: np.empty(chunk_size, dtype) for name, dtype in self.columns}
+        self._time = self.buffers['time']
+        self._iface = self.buffers['iface']
+        self._value = self.buffers['value']
+        self.files = {name: open(os.path.join(path, name + '.bin'), 'wb') for name, _ in self.columns}
+        self.closed = False
+        self.write_meta()
+        atexit.register(self.close)
+
+    def interface(self, name, label=None):
+        """
+        Id of the interface `name`, registering it on first use.
+        """
+        iface = self.index.get(name)
+        if iface is None:
+            iface = len(self.interfaces)
+            if iface > np.iinfo(self._iface.dtype).max:
+                raise ValueError(f'too many interfaces to record ({iface})')
+            self.index[name] = iface
+            self.interfaces.append(name)
+            self.labels.append(label if label is not None else name)
+            self.write_meta()
+        return iface
+
+    def record(self, iface, time, value):
+        n = self.n
+        self._time[n] = time
+        self._iface[n] = iface
+        self._value[n] = value
+        self.n = n + 1
+        if self.n == self.chunk_size:
+            self.flush()
+
+    def record_many(self, ifaces, time, values):
+        """
+        Records one sample per interface, all at the same time.
+        """
+        ifaces = np.asarray(ifaces)
+        values = np.asarray(values)
+        start = 0
+        while start < len(ifaces):
+            m = min(len(ifaces) - start, self.chunk_size - self.n)
+            rows = slice(self.n, self.n + m)
+            self._time[rows] = time
+            self._iface[rows] = ifaces[start:start + m]
+            self._value[rows] = values[start:start + m]
+            self.n += m
+            start += m
+            if self.n == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered rows to the column files.
+        """
+        if self.n:
+            bad = ~np.isfinite(self._value[:self.n])
+            if bad.any():
+                self.flag_nonfinite(self._iface[:self.n][bad])
+            for name, f in self.files.items():
+                self.buffers[name][:self.n].tofile(f)
+            self.rows += self.n
+            self.n = 0
+        for f in self.files.values():
+            f.flush()
+        self.write_meta()
+
+    def flag_nonfinite(self, ifaces):
+        """
+        Counts non-finite stored values of interfaces `ifaces` (one entry
+        per value), warning on the first of each interface.
+        """
+        for iface, count in enumerate(np.bincount(ifaces)):
+            if not count:
+                continue
+            name = self.interfaces[iface]
+            if name not in self.nonfinite and self.logger is not None:
+                self.logger.warning('Recorded a non-finite value of %s (an inf/nan input, or out of %s range)',
+                                    name, self._value.dtype)
+            self.nonfinite[name] = self.nonfinite.get(name, 0) + int(count)
+
+    def write_meta(self):
+        meta = dict(self.meta)
+        meta.update({
+            'format': FORMAT_VERSION,
+            'columns': {name: dtype.str for name, dtype in self.columns},
+            'rows': self.rows,
+            'nonfinite': self.nonfinite,
+            'interfaces': self.interfaces,
+            'labels': self.labels,
+        })
+        tmp = os.path.join(self.path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.closed = True
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Results:
+    """
+    Read-only view of a recorder run directory. Columns are memory-mapped,
+    and rows written after the last meta.json update (e.g. by a run that
+    crashed) are still picked up from the column files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.interfaces = self.meta['interfaces']
+        self.labels = dict(zip(self.interfaces, self.meta['labels']))
+        self.index = {name: i for i, name in enumerate(self.interfaces)}
+        self.nonfinite = self.meta.get('nonfinite', {})
+        dtypes = {name: np.dtype(dtype) for name, dtype in self.meta['columns'].items()}
+        files = {name: os.path.join(path, name + '.bin') for name in dtypes}
+        self.rows = min(os.path.getsize(files[name]) // dtypes[name].itemsize for name in dtypes)
+        self.columns = {}
+        for name, dtype in dtypes.items():
+            if self.rows:
+                self.columns[name] = np.memmap(files[name], dtype=dtype, mode='r', shape=(self.rows,))
+            else:
+                self.columns[name] = np.empty(0, dtype)
+
+    def __len__(self):
+        return self.rows
+
+    def series(self, name):
+        """
+        (time, value) arrays of one interface, in recording order.
+        """
+        mask = self.columns['iface'] == self.index[name]
+        return np.asarray(self.columns['time'][mask]), np.asarray(self.columns['value'][mask])
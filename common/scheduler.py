@@ -0,0 +1,111 @@
+"""
+Multi-rate scheduler for federate time loops.
+
+Recurring tasks (power flow every 60 s, real-time market every 300 s, ...)
+are kept in one heap of pending events. Each task runs `buffer` seconds
+ahead of its interval boundary and can have follow-up phases, e.g. read
+the ISO's answer 2 s after publishing:
+
+    scheduler = Scheduler(partial(h.helicsFederateRequestTime, fed))
+    scheduler.add('real_time_market', 300, publish_bids, buffer=1, phases=[(2, read_prices)])
+    scheduler.add('physics_powerflow', 60, publish_loads, buffer=1, phases=[(2, read_voltages)])
+    scheduler.run(until=7200)
+
+The scheduler only ever requests the time of the earliest pending event,
+and every event due at the granted time, from any task, runs on that one
+grant. A time grant is a federation-wide barrier, so coincident market
+and power flow steps share their grants instead of each taking its own.
+Actions are called with the granted time.
+"""
+
+import heapq
+import itertools
+
+
+class Task:
+    def __init__(self, name, interval, action, phases=(), priority=0):
+        self.name = name
+        self.priority = priority
+        self.interval = interval
+        self.action = action
+        self.phases = list(phases)
+        self.runs = 0
+
+
+class Scheduler:
+    """
+    :param request_time: callable requesting a time and returning the
+        granted time, e.g. partial(h.helicsFederateRequestTime, fed)
+    """
+
+    def __init__(self, request_time):
+        self.request_time = request_time
+        self.tasks = []
+        self.queue = []
+        self.grants = 0
+        self.events = 0
+        self._seq = itertools.count()
+
+    def add(self, name, interval, action, offset=0, buffer=0, phases=()):
+        """
+        Schedules `action` every `interval` seconds, first at
+        offset + interval - buffer. Each (delay, callable) in `phases` runs
+        `delay` seconds after every run of `action`. Tasks added earlier
+        run first when events coincide.
+        """
+        task = Task(name, interval, action, phases, priority=len(self.tasks))
+        self.tasks.append(task)
+        self.push(offset + interval - buffer, task, -1)
+        return task
+
+    def push(self, time, task, phase):
+        heapq.heappush(self.queue, (time, task.priority, phase, next(self._seq), task))
+
+    def next_time(self):
+        return self.queue[0][0] if self.queue else None
+
+    def run(self, until, execute=True):
+        """
+        Requests times and runs due events until no task has an event at
+        or before `until`; follow-up phases of the last runs are completed
+        even past it.
+
+        :param execute: False only walks the schedule (see `plan`)
+        :return: last granted time
+        """
+        # Recurrences past `until` are never queued
+        self.queue = [entry for entry in self.queue if entry[2] >= 0 or entry[0] <= until]
+        heapq.heapify(self.queue)
+        granted = None
+        while self.queue:
+            granted = self.request_time(self.queue[0][0])
+            self.grants += 1
+            while self.queue and self.queue[0][0] <= granted:
+                time, _, phase, _, task = heapq.heappop(self.queue)
+                self.events += 1
+                if phase >= 0:
+                    if execute:
+                        task.phases[phase][1](granted)
+                    continue
+                if execute:
+                    task.action(granted)
+                task.runs += 1
+                if time + task.interval <= until:
+                    self.push(time + task.interval, task, -1)
+                for i, (delay, _) in enumerate(task.phases):
+                    self.push(time + delay, task, i)
+        return granted
+
+    def plan(self, until):
+        """
+        Times that `run(until)` would request if every request were
+        granted as asked, without running any action.
+        """
+        times = []
+        dry_run = Scheduler(lambda t: times.append(t) or t)
+        for task in self.tasks:
+            dry_run.tasks.append(Task(task.name, task.interval, None, task.phases, task.priority))
+        for time, priority, phase, _, task in self.queue:
+            dry_run.push(time, dry_run.tasks[priority], phase)
+        dry_run.run(until, execute=False)
+        return times
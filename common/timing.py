@@ -0,0 +1,325 @@
+"""
+Per-grant timing of federate time loops.
+
+A StepTimer splits the wall-clock time of every step (grant to grant)
+into
+
+    wait      blocked in the time request, waiting for the federation
+    read      reading inputs
+    publish   publishing outputs
+    compute   everything else the federate did in the step, including
+              work overlapped with an asynchronous time request
+
+and appends one row per grant to results/<federate>/timing.csv, with the
+absolute wall-clock times (epoch seconds) at which the request was made
+and granted so that traces of several federates can be lined up, and the
+number of values read and published in the step (calls of `timed`
+functions, plus what the federate adds with `count`). On close it also
+writes process.json next to it with the process's peak resident set size
+(VmHWM, read from /proc on Linux; null elsewhere). It is
+switched on from the "timing" block of the federate's entry in
+multi_site_config.json (or of its own JSON config):
+
+    "timing": {"enabled": true, "profile": "cprofile"}
+
+"profile" optionally adds a profiler for the whole run: "cprofile" writes
+profile.pstats, "sampling" samples the federate thread's stack every
+"sample_interval" seconds (default 0.005) and writes samples.folded,
+collapsed stacks for flame graph tools; leave "profile" out rather than
+setting it to null, which HELICS rejects when it parses the config (it
+reads "profile" keys at any depth). A disabled timer costs one
+attribute check per call, and `timed` hands back the callable unchanged.
+
+    timer = timing.setup('transmission')
+    read = timer.timed('read', read)
+    fed.enter_executing_mode()
+    timer.start()
+    ...
+    with timer.phase('publish'):
+        pub.publish(x)
+    granted_time = timer.request(fed.request_time, requested_time)
+    ...
+    timer.close()
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import cProfile
+import threading
+import contextlib
+from collections import Counter
+
+import fedlog
+from recorder import RESULTS_DIR
+
+
+COLUMNS = ('step', 'requested', 'granted', 'request_start', 'request_end', 'wait', 'read', 'compute', 'publish',
+           'reads', 'publishes')
+PHASES = ('read', 'publish', 'compute')
+PROFILERS = ('cprofile', 'sampling')
+
+
+class _Phase:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StepTimer:
+    """
+    Times the steps of one federate and writes them to `path` (a CSV file,
+    by default results/<federate>/timing.csv) every `flush_every` rows and
+    on close.
+    """
+
+    def __init__(self, federate, path=None, enabled=True, profile=None, sample_interval=0.005, flush_every=256):
+        self.federate = federate
+        self.enabled = enabled
+        self.dir = os.path.join(RESULTS_DIR, federate)
+        self.path = path or os.path.join(self.dir, 'timing.csv')
+        self.flush_every = flush_every
+        self.rows = []
+        self.steps = 0
+        self.totals = dict.fromkeys(('wait', 'read', 'compute', 'publish'), 0.0)
+        self._acc = dict.fromkeys(PHASES, 0.0)
+        self._counts = {'read': 0, 'publish': 0}
+        self._overlap = 0.0
+        self._pending = None
+        self._file = None
+        self._profiler = None
+        self._sampler = None
+        if not enabled:
+            return
+        if profile is not None and profile not in PROFILERS:
+            raise ValueError(f'unknown profiler "{profile}", expected one of {PROFILERS}')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+        # perf_counter is monotonic; the offset turns it into epoch seconds
+        self._epoch = time.time() - time.perf_counter()
+        if profile == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif profile == 'sampling':
+            self._sampler = StackSampler(threading.get_ident(), sample_interval)
+            self._sampler.start()
+        self._last_grant = time.perf_counter()
+        atexit.register(self.close)
+
+    def start(self):
+        """
+        Starts the first step now, e.g. on entering executing mode, so that
+        set-up time is not counted as compute.
+        """
+        if self.enabled:
+            self._acc = dict.fromkeys(PHASES, 0.0)
+            for name in self._counts:
+                self._counts[name] = 0
+            self._last_grant = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Context manager adding the time spent in its block to phase `name`
+        ("read", "publish" or "compute") of the current step.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        self._acc[name] += seconds
+        if self._pending is not None:
+            self._overlap += seconds
+
+    def count(self, name, n=1):
+        """
+        Adds `n` values read ("read") or published ("publish") to the
+        current step.
+        """
+        if self.enabled:
+            self._counts[name] += n
+
+    def timed(self, name, func):
+        """
+        `func` wrapped so that every call is timed as phase `name`, and
+        counted as one value for "read" and "publish"; `func` itself when
+        the timer is disabled.
+        """
+        if not self.enabled:
+            return func
+        perf_counter = time.perf_counter
+        add = self.add
+        counts = self._counts
+
+        def timed_func(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(name, perf_counter() - start)
+                if name in counts:
+                    counts[name] += 1
+        return timed_func
+
+    def begin_request(self, requested):
+        """
+        Marks the start of a time request; work timed with `phase` until
+        `end_request` counts as compute overlapped with the request.
+        """
+        if self.enabled:
+            self._pending = (requested, time.perf_counter())
+            self._overlap = 0.0
+
+    def end_request(self, granted):
+        """
+        Marks the grant of the pending request and records the step.
+        """
+        if not self.enabled or self._pending is None:
+            return
+        now = time.perf_counter()
+        requested, start = self._pending
+        self._pending = None
+        read = self._acc['read']
+        publish = self._acc['publish']
+        # Phases timed during the request ran alongside it, not before it
+        work = start - self._last_grant - (read + publish + self._acc['compute'] - self._overlap)
+        compute = max(work, 0.0) + self._acc['compute']
+        wait = max(now - start - self._overlap, 0.0)
+        self.steps += 1
+        self.rows.append((self.steps, requested, granted, '%.6f' % (self._epoch + start), '%.6f' % (self._epoch + now),
+                          '%.6f' % wait, '%.6f' % read, '%.6f' % compute, '%.6f' % publish,
+                          self._counts['read'], self._counts['publish']))
+        for name, seconds in (('wait', wait), ('read', read), ('compute', compute), ('publish', publish)):
+            self.totals[name] += seconds
+        self._acc = dict.fromkeys(PHASES, 0.0)
+        for name in self._counts:
+            self._counts[name] = 0
+        self._last_grant = now
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def request(self, request_time, requested):
+        """
+        Calls request_time(requested), timing it as the step's wait, and
+        returns the granted time.
+        """
+        if not self.enabled:
+            return request_time(requested)
+        self.begin_request(requested)
+        granted = request_time(requested)
+        self.end_request(granted)
+        return granted
+
+    def flush(self):
+        if self._file is not None and self.rows:
+            self._writer.writerows(self.rows)
+            self._file.flush()
+            self.rows = []
+
+    def summary(self):
+        """
+        Share of the timed steps' wall-clock time per phase, e.g. for a
+        closing log line.
+        """
+        total = sum(self.totals.values()) or 1.0
+        return ', '.join('%s %.1f%%' % (name, 100 * seconds / total) for name, seconds in self.totals.items())
+
+    def close(self):
+        """
+        Writes the remaining rows and the profiler output. Safe to call
+        more than once.
+        """
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        with open(os.path.join(os.path.dirname(self.path), 'process.json'), 'w') as f:
+            json.dump({'pid': os.getpid(), 'peak_rss_mb': peak_rss_mb()}, f)
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(self.dir, 'profile.pstats'))
+        if self._sampler is not None:
+            self._sampler.stop()
+            self._sampler.write(os.path.join(self.dir, 'samples.folded'))
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the stack of thread `ident` every `interval` seconds and counts
+    the collapsed stacks ("module:function;module:function;...").
+    """
+
+    def __init__(self, ident, interval=0.005):
+        super().__init__(name='StackSampler', daemon=True)
+        self.target = ident
+        self.interval = interval
+        self.counts = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size (MB) of this process, or None where /proc is
+    not available. Unlike getrusage's ru_maxrss it starts over on exec, so
+    it does not include the parent's memory.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def from_config(federate, config, path=None):
+    """
+    StepTimer configured from a "timing" block; disabled if it is empty.
+    """
+    return StepTimer(federate, path=path, enabled=bool(config.get('enabled', False)),
+                     profile=config.get('profile'), sample_interval=config.get('sample_interval', 0.005))
+
+
+def setup(federate, config_path=None, path=None):
+    """
+    StepTimer configured from the "timing" block of the federate's config
+    (see fedlog.load_federate_config); disabled if there is none.
+    """
+    return from_config(federate, fedlog.load_federate_config(federate, config_path).get('timing', {}), path)
@@ -1,22 +1,27 @@
+import os
+import sys
+import re
 import math
 import json
 import numpy as np
 import helics as h
-import pandas as pd
+from functools import partial
 from datetime import datetime, timedelta
-import logging
-import random as r
-import pprint
-import matplotlib.pyplot as plt
 
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.StreamHandler())
-logger.setLevel(logging.DEBUG)
-
-# Setting up pretty printing, mostly for debugging.
-pp = pprint.PrettyPrinter(indent=4)
-
-r.seed(2608)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+import fedlog
+import timing
+import bidcodec
+from profile_store import ProfileStore
+from scheduler import Scheduler
+from recorder import Recorder, RESULTS_DIR
+
+# Bids, loads, prices and voltages exchanged with the ISO are logged on the
+#   "interfaces" subsystem logger. Handlers are only attached when run as a
+#   federate (fedlog.setup below), so importing the module does not start a
+#   log writer
+logger = fedlog.get_logger('distribution3')
+ilog = fedlog.get_logger('distribution3', 'interfaces')
 
 def destroy_federate(fed):
     """
@@ -35,9 +40,66 @@ def destroy_federate(fed):
     grantedtime = h.helicsFederateRequestTime(fed, h.HELICS_TIME_MAXTIME)
     status = h.helicsFederateDisconnect(fed)
     h.helicsFederateFree(fed)
-    h.helicsCloseLibrary()
     logger.info("Federate finalized")
 
+def index_interfaces(fed):
+    """
+    Builds the (bus, interface kind) -> (key, handle) indices of the
+    federate's publications and inputs once after registration, e.g.
+    (13, 'rt_energy.bid') for publication "distribution3/pcc.13.rt_energy.bid"
+    and (13, 'lmp') for the input targeting "transmission/pcc.13.lmp".
+
+    :param fed: federate whose interfaces are indexed
+    :return: publication index, input index
+    """
+    pattern = re.compile(r'pcc\.(\d+)\.(.+)$')
+    pub_index = {}
+    for pub_idx in range(h.helicsFederateGetPublicationCount(fed)):
+        pub_object = h.helicsFederateGetPublicationByIndex(fed, pub_idx)
+        key = h.helicsPublicationGetName(pub_object)
+        match = pattern.search(key)
+        if match:
+            pub_index[(int(match.group(1)), match.group(2))] = (key, pub_object)
+    sub_index = {}
+    for sub_idx in range(h.helicsFederateGetInputCount(fed)):
+        sub_object = h.helicsFederateGetInputByIndex(fed, sub_idx)
+        key = h.helicsInputGetTarget(sub_object)
+        match = pattern.search(key)
+        if match:
+            sub_index[(int(match.group(1)), match.group(2))] = (key, sub_object)
+    return pub_index, sub_index
+
+class BidGenerator:
+    """
+    Real-time market bids for all co-simulation buses in one vectorized
+    step. Every bus bids its price-responsive load as a constant block
+    plus `blocks` flexible blocks covering `flexibility` of it, at prices
+    falling linearly across `P_range`; the normalized curve shapes are
+    computed once and only scaled per bus.
+    """
+
+    def __init__(self, n_buses, rng, flexibility=.20, blocks=10, P_range=(10, 30), nominal_cleared_price=100):
+        self.n_buses = n_buses
+        self.rng = rng
+        self.flexibility = flexibility
+        self.nominal_cleared_price = nominal_cleared_price
+        self.P_bid = np.linspace(max(P_range), min(P_range), blocks)
+        self.Q_shape = np.linspace(0, 1, blocks)
+
+    def generate(self, cleared_price):
+        """
+        :param cleared_price: last cleared price of each bus
+        :return: constant_kW (n_buses,), constant_kVAR (n_buses,),
+            P_bid (blocks,) shared by all buses, Q_bid (n_buses, blocks)
+        """
+        load_scaling_factor = (np.asarray(cleared_price) - self.nominal_cleared_price) / self.nominal_cleared_price
+        constant_kW = 12 + (2 * self.rng.random(self.n_buses)) - (5 * load_scaling_factor)
+        # Hard-coded value for multi-site demo
+        # constant_kVAR = constant_kW*base_kVAR/base_kW
+        constant_kVAR = constant_kW * 0.2
+        Q_bid = np.outer(constant_kW * self.flexibility, self.Q_shape)
+        return constant_kW, constant_kVAR, self.P_bid, Q_bid
+
 def create_broker(simulators):
     initstring = "--federates=" + str(simulators) + " --name=mainbroker"
     broker = h.helicsCreateBroker("zmq", "", initstring)
@@ -48,21 +110,17 @@ def create_broker(simulators):
     return broker
 
 
-def get_load_profiles(wrapper_config):
-
-    load_profile_path = wrapper_config['matpower_most_data']['datapath'] + wrapper_config['matpower_most_data']['load_profile_info']['filename']
-    input_resolution = wrapper_config['matpower_most_data']['load_profile_info']['resolution']
-    input_data_reference_time =  datetime.strptime(wrapper_config['matpower_most_data']['load_profile_info']['starting_time'], '%Y-%m-%d %H:%M:%S')
-    start_data_point = int((start_date - input_data_reference_time).total_seconds() / input_resolution)
-    end_data_point   = int((end_date - input_data_reference_time).total_seconds() / input_resolution)
-    load_profile_data = pd.read_csv(load_profile_path, skiprows = start_data_point+1, nrows=(end_data_point-start_data_point)+1, header=None)
-    new_col_idx = load_profile_data.shape[1]
-    load_profile_data[new_col_idx] = pd.date_range(start=start_date, end = end_date, freq='5min')
-    load_profile_data.set_index(new_col_idx, inplace=True)
-    sample_interval = str(wrapper_config['physics_powerflow']['interval'])+'s'
-    load_profile_data_pf_interval = load_profile_data.resample(sample_interval).interpolate()
+def get_load_profiles(wrapper_config, base_dir):
+    """
+    Load profiles of the MATPOWER wrapper config, resampled to its power
+    flow and market intervals and served from a memory-mapped cache that
+    is only rebuilt when the CSV changes.
 
-    return load_profile_data_pf_interval
+    :param wrapper_config: matpowerwrapper_config.json contents
+    :param base_dir: directory of the wrapper config ("datapath" is relative to it)
+    :return: ProfileStore; look loads up with .value(time, bus, interval)
+    """
+    return ProfileStore.from_wrapper_config(wrapper_config, base_dir)
 
 
 def create_helics_configuration(helics_config, filename):
@@ -98,7 +156,157 @@ def create_helics_configuration(helics_config, filename):
 
     return
 
+def run_federate(config, wrapper_config):
+    """
+    Runs the DSO federate on `config` (its JSON config as a dict) over the
+    period and markets of `wrapper_config` (matpowerwrapper_config.json
+    contents). The HELICS library is left open for the caller to close, as
+    other federates may share the process.
+    """
+    start_date = datetime.strptime(wrapper_config['start_time'], '%Y-%m-%d %H:%M:%S')
+    end_date   = datetime.strptime(wrapper_config['end_time'], '%Y-%m-%d %H:%M:%S')
+    duration   = (end_date - start_date).total_seconds()
+
+
+    ##### Registering DSO Federate #####
+    fed = h.helicsCreateCombinationFederateFromConfig(json.dumps(config))
+    logger.info('DSO: Registering %s Federate', h.helicsFederateGetName(fed))
+
+    ##### Indexing interfaces by (bus, kind) once for all publishes and reads #####
+    pub_index, sub_index = index_interfaces(fed)
+    logger.info('DSO: %s Federate has %d Publications', h.helicsFederateGetName(fed), h.helicsFederateGetPublicationCount(fed))
+    logger.info('DSO: %s Federate has %d Inputs', h.helicsFederateGetName(fed), h.helicsFederateGetInputCount(fed))
+    # Only co-sim buses this DSO has interfaces for take part
+    rt_buses = [cosim_bus for cosim_bus in wrapper_config['real_time_market']['cosimulation_bus']
+                if (cosim_bus, 'rt_energy.bid') in pub_index and (cosim_bus, 'lmp') in sub_index]
+    pf_buses = [cosim_bus for cosim_bus in wrapper_config['physics_powerflow']['cosimulation_bus']
+                if (cosim_bus, 'pq') in pub_index and (cosim_bus, 'pnv') in sub_index]
+    for cosim_bus in set(wrapper_config['real_time_market']['cosimulation_bus']) - set(rt_buses):
+        logger.warning('DSO: No bid/LMP interfaces for market bus %s, skipping it', cosim_bus)
+    for cosim_bus in set(wrapper_config['physics_powerflow']['cosimulation_bus']) - set(pf_buses):
+        logger.warning('DSO: No load/voltage interfaces for power flow bus %s, skipping it', cosim_bus)
+    if not rt_buses and not pf_buses:
+        name = h.helicsFederateGetName(fed)
+        h.helicsFederateDestroy(fed)
+        raise ValueError('DSO: {} has no bid/LMP or load/voltage interfaces for any co-sim bus'.format(name))
+
+    ##### Recording loads, prices and voltages at the co-sim buses #####
+    recorder = Recorder(os.path.join(RESULTS_DIR, 'distribution3'), logger=logger)
+    load_plot = {'file': 'Distribution 3 Real Load.png', 'xlabel': 'Time(s)', 'time_scale': 1,
+                 'left': [], 'right': [], 'left_label': 'Load (kW)'}
+    recorder.meta['plots'] = [load_plot]
+    lmp_ids, load_ids, voltage_ids = [], [], []
+    if wrapper_config['include_real_time_market']:
+        for cosim_bus in rt_buses:
+            lmp_ids.append(recorder.interface(sub_index[(cosim_bus, 'lmp')][0], 'Bus {} LMP ($/MWh)'.format(cosim_bus)))
+    if wrapper_config['include_physics_powerflow']:
+        for cosim_bus in pf_buses:
+            load_plot['left'].append(pub_index[(cosim_bus, 'pq')][0])
+            load_ids.append(recorder.interface(pub_index[(cosim_bus, 'pq')][0], 'Bus {} load (kW)'.format(cosim_bus)))
+            voltage_ids.append(recorder.interface(sub_index[(cosim_bus, 'pnv')][0], 'Bus {} voltage (V)'.format(cosim_bus)))
+
+    #####  Entering Execution for DSO Federate #####
+    status = h.helicsFederateEnterExecutingMode(fed)
+    logger.info('DSO: Federate %s Entering execution', h.helicsFederateGetName(fed))
+
+    buffer = 1  ###### Buffer to sending out data before the Operational Cycle  ######
+    exchange_delay = 2  ###### ISO answers are read this long after publishing ######
+
+    # Bids go out in the compact binary format unless the ISO needs JSON
+    #   (the MATLAB transmission federate only reads JSON bids)
+    bid_encoding = wrapper_config['real_time_market'].get('bid_encoding', 'binary')
+    publish_bid = h.helicsPublicationPublishBytes if bid_encoding == 'binary' else h.helicsPublicationPublishString
+    logger.info('DSO: Publishing %s bids', bid_encoding)
+
+    # Timing every grant; reads and publishes are timed through these
+    timer = timing.from_config('distribution3', config['timing']) if 'timing' in config else timing.setup('distribution3')
+    publish_bid = timer.timed('publish', publish_bid)
+    publish_load = timer.timed('publish', h.helicsPublicationPublishComplex)
+    get_string = timer.timed('read', h.helicsInputGetString)
+    get_complex = timer.timed('read', h.helicsInputGetComplex)
+
+    rng = np.random.default_rng(2608)
+    bid_generator = BidGenerator(len(rt_buses), rng)
+    cleared_price = np.full(len(rt_buses), 100.0) # Initial value
+    bid_pubs = [pub_index[(cosim_bus, 'rt_energy.bid')] for cosim_bus in rt_buses]
+    lmp_subs = [sub_index[(cosim_bus, 'lmp')] for cosim_bus in rt_buses]
+    load_pubs = [pub_index[(cosim_bus, 'pq')] for cosim_bus in pf_buses]
+    voltage_subs = [sub_index[(cosim_bus, 'pnv')] for cosim_bus in pf_buses]
+
+    ######## Real time Market Intervals ########
+    def publish_bids(time_granted):
+        logger.debug('\tDSO: Real time market at %s', start_date + timedelta(seconds=time_granted))
+        # Hard-coding value for multi-site demo
+        # current_load_profile = load_profiles.row(time_granted + buffer, wrapper_config['real_time_market']['interval'])
+        # current_kW = current_load_profile[[load_profiles.columns[cosim_bus] for cosim_bus in rt_buses]]
+        constant_kW, constant_kVAR, P_bid, Q_bid = bid_generator.generate(cleared_price)
+        bids_raw = bidcodec.encode_many(constant_kW, constant_kVAR, P_bid, Q_bid, bid_encoding)
+
+        #####  Publishing current loads for Co-SIM Bus the ISO Simulator #####
+        for (pub_key, pub_object), bid_raw in zip(bid_pubs, bids_raw):
+            status = publish_bid(pub_object, bid_raw)
+            fedlog.value(ilog, time_granted, pub_key, bid_raw)
+
+    def read_prices(time_granted):
+        for k, (sub_key, sub_object) in enumerate(lmp_subs):
+            allocation_raw = get_string(sub_object)
+            allocation = json.loads(allocation_raw)
+            cleared_price[k] = allocation['P_clear']
+            fedlog.value(ilog, time_granted, sub_key, cleared_price[k])
+        recorder.record_many(lmp_ids, time_granted, cleared_price)
+
+    ######## Power Flow Intervals ########
+    def publish_loads(time_granted):
+        logger.debug('\tDSO: Power flow at %s', start_date + timedelta(seconds=time_granted))
+        # Hard-coding value for multi-site demo
+        # current_load_profile = load_profiles.row(time_granted + buffer, wrapper_config['physics_powerflow']['interval'])
+        # current_kW = current_load_profile[[load_profiles.columns[cosim_bus] for cosim_bus in pf_buses]]
+        current_kW = 12 + (2 * rng.random(len(pf_buses)))
+        # Hard-coded value for multi-site demo
+        #current_kVAR = current_kW*base_kVAR/base_kW
+        current_kVAR = current_kW*0.2
+
+        #####  Publishing current loads for Co-SIM Bus the ISO Simulator #####
+        for (pub_key, pub_object), P, Q in zip(load_pubs, current_kW.tolist(), current_kVAR.tolist()):
+            status = publish_load(pub_object, P, Q)
+            fedlog.value(ilog, time_granted, pub_key, complex(P, Q))
+        recorder.record_many(load_ids, time_granted, current_kW)
+
+    def read_voltages(time_granted):
+        for (sub_key, sub_object), voltage_id in zip(voltage_subs, voltage_ids):
+            voltage = get_complex(sub_object)
+            fedlog.value(ilog, time_granted, sub_key, voltage)
+            recorder.record(voltage_id, time_granted, abs(voltage))
+
+    ##### Scheduling the enabled activities; coincident ones share a time grant #####
+    def request_time(time_request):
+        time_granted = timer.request(partial(h.helicsFederateRequestTime, fed), time_request)
+        logger.debug('DSO: Requested %ss and got Granted %ss', time_request, time_granted)
+        return time_granted
+
+    scheduler = Scheduler(request_time)
+    if wrapper_config['include_real_time_market']:
+        scheduler.add('real_time_market', wrapper_config['real_time_market']['interval'], publish_bids,
+                      buffer=buffer, phases=[(exchange_delay, read_prices)])
+    if wrapper_config['include_physics_powerflow']:
+        scheduler.add('physics_powerflow', wrapper_config['physics_powerflow']['interval'], publish_loads,
+                      buffer=buffer, phases=[(exchange_delay, read_voltages)])
+    timer.start()
+    scheduler.run(duration)
+    logger.info('DSO: %d time grants for %d scheduled events (%s)', scheduler.grants, scheduler.events,
+                ', '.join('{} x{}'.format(task.name, task.runs) for task in scheduler.tasks))
+
+    
+    destroy_federate(fed)
+    recorder.close()
+    logger.info('Recorded %d samples to %s', recorder.rows, recorder.path)
+    if timer.enabled:
+        timer.close()
+        logger.info('DSO: %d steps timed (%s), see %s', timer.steps, timer.summary(), timer.path)
+    logger.info('Graphs can be rendered with tools/plot_results.py %s', recorder.path)
+
 if __name__ == "__main__":
+    fedlog.setup('distribution3')
     json_path = '../transmission/matpowerwrapper_config.json'
     with open(json_path, 'r') as f:
         wrapper_config = json.loads(f.read())
@@ -109,21 +317,13 @@ if __name__ == "__main__":
 #         logger.info(f.read())
 #         case = json.loads(f.read())
 
-    timestamp = []
-    load_data = []
-
-    start_date = datetime.strptime(wrapper_config['start_time'], '%Y-%m-%d %H:%M:%S')
-    end_date   = datetime.strptime(wrapper_config['end_time'], '%Y-%m-%d %H:%M:%S')
-    duration   = (end_date - start_date).total_seconds()
-
-
     ##### Getting Load Profiles from input Matpower data #####
     # Hard-coding load for multi-side demo
-    #load_profiles = get_load_profiles(wrapper_config)
+    #load_profiles = get_load_profiles(wrapper_config, os.path.dirname(json_path))
 
 
     ##### Setting up HELICS Configuration #####
-    logger.info('DSO: HELICS Version {}'.format(h.helicsGetVersion()))
+    logger.info('DSO: HELICS Version %s', h.helicsGetVersion())
     helics_config_filename = 'demo_DSO.json'
     #create_helics_configuration(wrapper_config['helics_config'], helics_config_filename)
 
@@ -131,167 +331,7 @@ if __name__ == "__main__":
     # h.helicsBrokerDisconnect(broker)
     broker = create_broker(2)
 
-
-    ##### Registering DSO Federate #####
-    fed = h.helicsCreateCombinationFederateFromConfig('demo_DSO.json')
-    logger.info('DSO: Registering {} Federate'.format(h.helicsFederateGetName(fed)))
-
-    pubkeys_count = h.helicsFederateGetPublicationCount(fed)
-    pub_keys = []
-    for pub_idx in range(pubkeys_count):
-        pub_object = h.helicsFederateGetPublicationByIndex(fed, pub_idx)
-        pub_keys.append(h.helicsPublicationGetName(pub_object))
-    logger.info('DSO: {} Federate has {} Publications'.format(h.helicsFederateGetName(fed), pubkeys_count))
-
-
-    subkeys_count = h.helicsFederateGetInputCount(fed)
-    sub_keys = []
-    for sub_idx in range(subkeys_count):
-        sub_object = h.helicsFederateGetInputByIndex(fed, sub_idx)
-        sub_keys.append(h.helicsSubscriptionGetTarget(sub_object))
-    logger.info('DSO: {} Federate has {} Inputs'.format(h.helicsFederateGetName(fed), subkeys_count))
-
-    # logger.info(pub_keys)
-    # logger.info(sub_keys)
-
-    #####  Entering Execution for DSO Federate #####
-    status = h.helicsFederateEnterExecutingMode(fed)
-    logger.info('DSO: Federate {} Entering execution'.format(h.helicsFederateGetName(fed)))
-
-    buffer = 1  ###### Buffer to sending out data before the Operational Cycle  ######
-    tnext_physics_powerflow = wrapper_config['physics_powerflow']['interval']-buffer
-    tnext_real_time_market  = wrapper_config['real_time_market']['interval']-buffer
-    tnext_day_ahead_market  = wrapper_config['day_ahead_market']['interval']-buffer
-
-
-    # duration = 300
-    time_granted = -1
-    
-    flexibility = .20
-    blocks = 10
-    P_range = np.array([10, 30]) 
-    nominal_cleared_price = 100
-    cleared_price = 100 # Initial value
-    
-    while time_granted <= duration:
-        
-        next_helics_time = min([tnext_physics_powerflow, tnext_real_time_market, tnext_day_ahead_market]);
-        
-        time_granted = h.helicsFederateRequestTime(fed, next_helics_time)
-
-        logger.info('DSO: Requested {}s and got Granted {}s'.format(next_helics_time, time_granted))
-        current_time = start_date + timedelta(seconds=time_granted)
-        logger.info('\tDSO: Current Time is {}'.format(current_time))
-
-
-        ######## Real time Market Intervals ########
-        if time_granted >= tnext_real_time_market and wrapper_config['include_real_time_market']:
-            
-            profile_time = current_time + timedelta(seconds=buffer)
-            # Hard-coding value for multi-site demo
-            # data_idx = load_profiles.index[load_profiles.index == profile_time]
-            # current_load_profile = load_profiles.loc[data_idx]
-            for cosim_bus in wrapper_config['real_time_market']['cosimulation_bus']:
-#                 Hard-coding value for multi-site demo
-#                 base_kW = case['bus'][cosim_bus-1][2]
-#                 base_kVAR = case['bus'][cosim_bus - 1][3]
-#                 current_kW = current_load_profile[cosim_bus].values[0]
-                load_scaling_factor = 1 * (cleared_price - nominal_cleared_price)/nominal_cleared_price
-                logger.info(f'\t\tload_scaling_factor: {load_scaling_factor}')
-                current_kW = 12 + (2 * r.random()) - (5 * load_scaling_factor)
-                logger.info(f'\t\tcurrent_kW: {current_kW}')
-                constant_load = current_kW
-                flex_load = current_kW*(flexibility)
-                Q_values = np.linspace(0, flex_load, blocks)
-                P_values = np.linspace(max(P_range), min(P_range), blocks)
-                
-                # Hard-coded value for multi-site demo
-                # current_load = complex(current_kW, current_kW*base_kVAR/base_kW)
-                current_load = complex(current_kW, current_kW*0.2)
-                bid =  dict()
-                bid['constant_kW'] = constant_load
-                # bid['constant_kVAR'] = constant_load*base_kVAR/base_kW
-                # Hard-coded value for multi-site demo
-                bid['constant_kVAR'] = constant_load*0.2
-                bid['P_bid'] = list(P_values)
-                bid['Q_bid'] = list(Q_values)
-                
-                
-                bid_raw = json.dumps(bid)
-                
-                 #####  Publishing current loads for Co-SIM Bus the ISO Simulator #####
-                pub_key = [key for key in pub_keys  if ('pcc.' + str(cosim_bus) + '.rt_energy.bid') in key ]
-                pub_object = h.helicsFederateGetPublication(fed, pub_key[0])
-                status = h.helicsPublicationPublishString(pub_object, bid_raw)
-                logger.info('\tDSO: Published Bids for Bus {}'.format(cosim_bus))
-                logger.info(f'\t\t{pp.pformat(bid_raw)}')
-                
-                                
-            time_request = time_granted+2
-            while time_granted < time_request:
-                time_granted = h.helicsFederateRequestTime(fed, time_request)
-
-            logger.info('DSO: Requested {}s and got Granted {}s'.format(time_request, time_granted))
-
-            for cosim_bus in wrapper_config['real_time_market']['cosimulation_bus']:
-                sub_key = [key for key in sub_keys  if ('pcc.' + str(cosim_bus) + '.lmp') in key ]
-                logger.info(f'\tSubscription key: {sub_key[0]}')
-                sub_object = h.helicsFederateGetSubscription(fed, sub_key[0])
-                allocation_raw = h.helicsInputGetString(sub_object)
-                allocation = json.loads(allocation_raw)
-                cleared_price = allocation['P_clear']
-                logger.info('\tDSO: Received cleared price {} for Bus {}'.format(cleared_price, cosim_bus))
-
-            tnext_real_time_market = tnext_real_time_market + wrapper_config['real_time_market']['interval']           
-            
-            
-            
-        ######## Power Flow Intervals ########
-        if time_granted >= tnext_physics_powerflow and wrapper_config['include_physics_powerflow']:
-            
-            profile_time = current_time + timedelta(seconds=buffer)
-            # Hard-coding value for multi-site demo
-#             data_idx = load_profiles.index[load_profiles.index == profile_time]
-#             current_load_profile = load_profiles.loc[data_idx]
-            for cosim_bus in wrapper_config['physics_powerflow']['cosimulation_bus']:
-#                 Hard-coding value for multi-site demo
-#                 base_kW = case['bus'][cosim_bus-1][2]
-#                 base_kVAR = case['bus'][cosim_bus - 1][3]
-                # current_kW = current_load_profile[cosim_bus].values
-                current_kW = 12 + (2 * r.random())
-                # Hard-coded value for multi-site demo
-                #current_load = complex(current_kW, current_kW*base_kVAR/base_kW)
-                current_load = complex(current_kW, current_kW*0.2)
-
-                #####  Publishing current loads for Co-SIM Bus the ISO Simulator #####
-                pub_key = [key for key in pub_keys  if ('pcc.' + str(cosim_bus) + '.pq') in key ]
-                pub_object = h.helicsFederateGetPublication(fed, pub_key[0])
-                status = h.helicsPublicationPublishComplex(pub_object, current_load.real, current_load.imag)
-                logger.info('\tDSO: Published {} demand for Bus {}'.format(current_load, cosim_bus))
-                
-                
-            load_data.append(current_kW)
-            timestamp.append(time_granted)
-
-            time_request = time_granted+2
-            while time_granted < time_request:
-                time_granted = h.helicsFederateRequestTime(fed, time_request)
-
-            logger.info('DSO: Requested {}s and got Granted {}s'.format(time_request, time_granted))
-
-            for cosim_bus in wrapper_config['physics_powerflow']['cosimulation_bus']:
-                sub_key = [key for key in sub_keys  if ('pcc.' + str(cosim_bus) + '.pnv') in key ]
-                sub_object = h.helicsFederateGetSubscription(fed, sub_key[0])
-                voltage = h.helicsInputGetComplex(sub_object)
-                logger.info('\tDSO: Received {} Voltage for Bus {}'.format(voltage, cosim_bus))
-
-            tnext_physics_powerflow = tnext_physics_powerflow + wrapper_config['physics_powerflow']['interval']
-
-    
-    destroy_federate(fed)
-
-
-    plt.plot(timestamp, load_data)
-    plt.xlabel('Time(s)')
-    plt.ylabel('Load (kW)')
-    plt.savefig('Distribution 3 Real Load.png')
\ No newline at end of file
+    with open(helics_config_filename, 'r') as f:
+        config = json.load(f)
+    run_federate(config, wrapper_config)
+    h.helicsCloseLibrary()
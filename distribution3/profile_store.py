@@ -0,0 +1,177 @@
+"""
+Load profiles for the DSO, converted once from the MATPOWER wrapper's CSV
+into memory-mapped arrays.
+
+The CSV (first column: seconds since the profile's starting time, then
+one "BusN" column per bus) is parsed on first use and saved as a .npy
+file in a ".profile_cache" directory next to it, together with one
+linearly resampled copy per interval asked for. A small JSON stamp
+records the source file's size and modification time; when either
+changes the cache is rebuilt. Later runs only map the arrays, so start-up
+cost and resident memory no longer grow with the length of the profile,
+and looking up the load at a simulation time is plain array indexing.
+
+    store = ProfileStore.from_wrapper_config(wrapper_config, '../transmission')
+    kW = store.value(time_granted, 13, interval=60)
+"""
+
+import os
+import re
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIR = '.profile_cache'
+CACHE_VERSION = 1
+
+
+class ProfileStore:
+    """
+    Profiles of one CSV file. `offset` is the number of seconds between the
+    profile's starting time and simulation time 0.
+    """
+
+    def __init__(self, csv_path, offset=0.0, data_map=None):
+        self.csv_path = os.path.abspath(csv_path)
+        self.offset = offset
+        self.cache_dir = os.path.join(os.path.dirname(self.csv_path), CACHE_DIR)
+        self.name = os.path.splitext(os.path.basename(self.csv_path))[0]
+        self.views = {}
+
+        stamp = self.source_stamp()
+        meta = self.read_meta()
+        if meta is None or meta['source'] != stamp:
+            meta = self.convert(stamp)
+        self.meta = meta
+        self.data = np.load(self.cache_file('raw'), mmap_mode='r')
+        self.seconds = np.load(self.cache_file('seconds'))
+
+        self.columns = {int(bus): col for bus, col in meta['buses'].items()}
+        if data_map is not None:
+            # MATPOWER column numbers are 1-based and count the time column
+            for col, bus in zip(data_map['columns'], data_map['bus']):
+                self.columns.setdefault(int(bus), int(col) - 2)
+
+    @classmethod
+    def from_wrapper_config(cls, wrapper_config, base_dir='.'):
+        """
+        Store for the load profile of a matpowerwrapper_config.json, with
+        resampled views for the power flow and market intervals prepared.
+
+        :param base_dir: directory "datapath" is relative to (the config's)
+        """
+        data = wrapper_config['matpower_most_data']
+        info = data['load_profile_info']
+        reference = datetime.strptime(info['starting_time'], '%Y-%m-%d %H:%M:%S')
+        start = datetime.strptime(wrapper_config['start_time'], '%Y-%m-%d %H:%M:%S')
+        store = cls(
+            os.path.join(base_dir, data['datapath'], info['filename']),
+            offset=(start - reference).total_seconds(),
+            data_map=info.get('data_map'),
+        )
+        for section in ('physics_powerflow', 'real_time_market', 'day_ahead_market'):
+            if section in wrapper_config:
+                store.view(wrapper_config[section]['interval'])
+        return store
+
+    def cache_file(self, kind):
+        return os.path.join(self.cache_dir, f'{self.name}.{kind}.npy')
+
+    def source_stamp(self):
+        st = os.stat(self.csv_path)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'version': CACHE_VERSION}
+
+    def read_meta(self):
+        try:
+            with open(os.path.join(self.cache_dir, f'{self.name}.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_meta(self, meta):
+        path = os.path.join(self.cache_dir, f'{self.name}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def save_array(self, path, array):
+        """
+        Saves `array` to `path` through a temporary file, so that other
+        processes sharing the cache never map a half-written array.
+        """
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+
+    def convert(self, stamp):
+        """
+        Parses the CSV into the raw .npy cache, dropping stale resampled views.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        frame = pd.read_csv(self.csv_path, skipinitialspace=True)
+        buses = {}
+        for col, name in enumerate(frame.columns[1:]):
+            match = re.search(r'(\d+)\s*$', str(name))
+            if match:
+                buses[match.group(1)] = col
+        stale = re.compile(re.escape(self.name) + r'\.\d+s\.npy$')
+        for entry in os.listdir(self.cache_dir):
+            if stale.match(entry):
+                os.remove(os.path.join(self.cache_dir, entry))
+        values = frame.to_numpy(dtype=float)
+        self.save_array(self.cache_file('seconds'), values[:, 0])
+        self.save_array(self.cache_file('raw'), values[:, 1:])
+        meta = {'source': stamp, 'buses': buses, 'intervals': []}
+        self.write_meta(meta)
+        return meta
+
+    def view(self, interval):
+        """
+        Profiles linearly resampled every `interval` seconds from the first
+        sample, one row per step and one column per CSV bus column.
+        """
+        interval = int(interval)
+        if interval in self.views:
+            return self.views[interval]
+        path = self.cache_file(f'{interval}s')
+        if interval not in self.meta['intervals'] or not os.path.exists(path):
+            n = int(np.floor((self.seconds[-1] - self.seconds[0]) / interval + 1e-9)) + 1
+            t = self.seconds[0] + interval * np.arange(n)
+            i = np.clip(np.searchsorted(self.seconds, t, side='right') - 1, 0, len(self.seconds) - 2)
+            span = self.seconds[i + 1] - self.seconds[i]
+            frac = ((t - self.seconds[i]) / span)[:, None]
+            self.save_array(path, self.data[i] * (1 - frac) + self.data[i + 1] * frac)
+            self.meta['intervals'] = sorted(set(self.meta['intervals']) | {interval})
+            self.write_meta(self.meta)
+        self.views[interval] = np.load(path, mmap_mode='r')
+        return self.views[interval]
+
+    def step(self, time, interval):
+        """
+        Row of the `interval` view holding simulation time `time` (s).
+
+        :raises ValueError: if `time` is outside the profile
+        """
+        k = int((time + self.offset - self.seconds[0]) // interval)
+        n = len(self.view(interval))
+        if not 0 <= k < n:
+            first = self.seconds[0] - self.offset
+            raise ValueError(f'time {time} s is outside the load profile {self.name}, which covers simulation times '
+                             f'{first:g} s to {first + (n - 1) * interval:g} s at {interval} s intervals')
+        return k
+
+    def row(self, time, interval):
+        """
+        Loads of every bus column at simulation time `time`.
+        """
+        return self.view(interval)[self.step(time, interval)]
+
+    def value(self, time, bus, interval):
+        """
+        Load of `bus` at simulation time `time` from the `interval` view.
+        """
+        return float(self.view(interval)[self.step(time, interval), self.columns[bus]])
@@ -1,138 +1,137 @@
 # Dummy federate of gas network  - SAInt tool
 
+import os
+import sys
+import json
+import argparse
+from functools import partial
 import helics as h
-import logging
+import numpy as np
 
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.StreamHandler())
-logger.setLevel(logging.DEBUG)
+from heat_rate import GasGenerators, CheckQLimit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+import fedlog
+import timing
+
+# Handlers are only attached when run as a federate (fedlog.setup below), so
+#   importing the module does not start a log writer
+logger = fedlog.get_logger('ng1')
+ilog = fedlog.get_logger('ng1', 'interfaces')
 
 def destroy_federate(fed):
     h.helicsFederateRequestTime(fed, h.HELICS_TIME_MAXTIME)
     h.helicsFederateDisconnect(fed)
     h.helicsFederateFree(fed)
-    h.helicsCloseLibrary()
     logger.info("Federate finalized")
 
-# Calculating the electrical output from the thermal power input iteratively
-def CalculatePMW (Y, X0):
-    iter = 0
-    X_new = X0
-    while iter < 20:       
-        delY = Y*3.6 - (HR0*X_new + HR1*X_new*X_new + HR2*X_new*X_new*X_new) # = Pthermal/3.6
-        if abs(delY) > 0.0001:
-            delY_delX = -(HR0 + 2*HR1*X_new + 3*HR2*X_new*X_new)
-            X_new = X_new - delY/delY_delX
-            iter+=1
-        else: break         
-    return X_new
-
-# Check for gas off-take limits
-def CheckQLimit(QSet):
-    if QSet > QMax:
-        QSet = QMax
-    elif QSet < QMin:
-        QSet = QMin
-    return QSet
-
-# Calculate thermal power from active power using heat rate
-def CalcPthermal(Pg):
-    HR = HR0 + HR1*Pg + HR2*Pg*Pg
-    return HR*Pg/3.6   # 3.6 is a MJ/kWh to MJ/MWh conversion factor  
+def run_federate(config, gen_config, end_time=10):
+    """
+    Runs the gas network federate on `config` (its JSON config as a dict)
+    for the gas-fired generators of `gen_config` (gas_generators.json
+    contents) until `end_time` seconds. The HELICS library is left open
+    for the caller to close, as other federates may share the process.
+    """
+    ##########  Gas-fired generators and their heat rates #############
+
+    gens = GasGenerators(gen_config)
+    if gens.inverse is not None:
+        logger.info("Inverse heat-rate table of %d points, max. error %.2g",
+                    gens.inverse.points, gens.inverse.error)
 
-if __name__ == "__main__":
-    
     ##########  Registering  federate and configuring from JSON #############
     
-    fed = h.helicsCreateValueFederateFromConfig("SAInt_ng1_Config.json")
+    fed = h.helicsCreateValueFederateFromConfig(json.dumps(config))
+    # The timing block of the federate's own config, else multi_site_config.json's
+    timer = timing.from_config('ng1', config['timing']) if 'timing' in config else timing.setup('ng1')
     federate_name = h.helicsFederateGetName(fed)
-    logger.info(f"Created federate {federate_name}")
+    logger.info("Created federate %s", federate_name)
 
     sub_count = h.helicsFederateGetInputCount(fed)
-    logger.debug(f"\tNumber of subscriptions: {sub_count}")
+    logger.debug("\tNumber of subscriptions: %d", sub_count)
     pub_count = h.helicsFederateGetPublicationCount(fed)
-    logger.debug(f"\tNumber of publications: {pub_count}")
+    logger.debug("\tNumber of publications: %d", pub_count)
+
+    requested_keys = [gen_config['requested_key'].format(node=node) for node in gens.nodes]
+    avail_keys = [f"{federate_name}/" + gen_config['avail_key'].format(node=node) for node in gens.nodes]
+    subs = [fed.subscriptions[key] for key in requested_keys]
+    pubs = [fed.publications[key] for key in avail_keys]
     
     # start initialization mode
     h.helicsFederateEnterInitializingMode(fed)
-    fed.publications["ng1/node.6.avail"].publish(0)
-    fed.publications["ng1/node.8.avail"].publish(0)
+    for pub in pubs:
+        pub.publish(0)
 
     ##############  Entering Execution Mode  ##################################
     h.helicsFederateEnterExecutingMode(fed)
     logger.info("Entered HELICS execution mode")
+    timer.start()
 
-    print(fed.publications.keys())
-    print(fed.subscriptions.keys())
+    logger.debug("\tPublications: %s", list(fed.publications.keys()))
+    logger.debug("\tSubscriptions: %s", list(fed.subscriptions.keys()))
     
     update_interval = int(h.helicsFederateGetTimeProperty(fed, h.HELICS_PROPERTY_TIME_PERIOD))
     grantedtime = 0
-    total_interval = 10
-    # Heat rate coefficients
-    HR0 = 20           # MJ/kWh
-    HR1 = -0.075       # (MJ/kWh)/MW 
-    HR2 = 0.001        # (MJ/kWh)/(MW*MW)
-    GCV = 39           # MJ/m^3
-    QMin = 0           # m^3/s
-    QMax = 1000        # m^3/s
+    total_interval = end_time
      
     # As long as granted time is in the time range to be simulated...
     while grantedtime < total_interval:
 
         # Time request for the next physical interval to be simulated
         requested_time = grantedtime + update_interval
-        logger.debug(f"Requesting time {requested_time}")
-        grantedtime = h.helicsFederateRequestTime(fed, requested_time)
-        logger.debug(f"Granted time {grantedtime}")
-
-        ############# Subscription from Transmission Nodes 6 and 8 ############
-
-        # Get the power output of node 6 in MW
-        P_Node6_MW = fed.subscriptions["transmission/node.6.requested"].double
-        logger.debug(f"\tReceived P_MW {P_Node6_MW:.2f}" f" from input Transmission Node 6")   
-        
-        # Get the power output of node 8 in MW
-        P_Node8_MW = fed.subscriptions["transmission/node.8.requested"].double
-        logger.debug(f"\tReceived P_MW {P_Node8_MW:.2f}" f" from input Transmission Node 8")
-        
-        ############# Publication for Transmission Node 6 ################
-        
-        # Calculate the thermal power and gas off take for Node 6
-        Pthermal_Node6_MW = CalcPthermal(P_Node6_MW)
-        QSET_Node6 = Pthermal_Node6_MW/GCV
-        logger.debug(f"\tQSET requested from transmission Node 6 (m^3/s): {QSET_Node6:.2f}")
-        
-        # Check for QSET limits
-        QSET_Node6 = CheckQLimit(QSET_Node6)
-        logger.debug(f"\tQSET available for transmission Node 6 (m^3/s): {QSET_Node6:.2f}")
-       
-        Pthermal_Node6_MW = GCV * QSET_Node6
-        
-        P_Node6_MW_new = CalculatePMW (Pthermal_Node6_MW, P_Node6_MW)
-        
-        # Publish available active power in MW
-        fed.publications["ng1/node.6.avail"].publish(P_Node6_MW_new)
-        logger.debug(f"\tElectrical output power available for Node 6 " f"{P_Node6_MW_new:.2f}")
+        logger.debug("Requesting time %s", requested_time)
+        grantedtime = timer.request(partial(h.helicsFederateRequestTime, fed), requested_time)
+        logger.debug("Granted time %s", grantedtime)
+
+        ############# Subscription from the transmission nodes ############
 
-        ############# Publication for Transmission Node 8 #################################
+        # Get the requested power output of every node in MW
+        with timer.phase('read'):
+            P_MW = np.array([sub.double for sub in subs])
+        timer.count('read', len(subs))
+        for key, P in zip(requested_keys, P_MW):
+            fedlog.value(ilog, grantedtime, key, P)
+
+        ############# Publication for the transmission nodes ################
+
+        # Calculate the thermal power and gas off take of every node
+        QSET = gens.gas_offtake(P_MW)
+        logger.debug("\tQSET requested from transmission nodes %s (m^3/s): %s", gens.nodes, QSET)
 
-        # Calculate the thermal power and gas off take for Node 8
-        Pthermal_Node8_MW = CalcPthermal(P_Node8_MW)
-        QSET_Node8 = Pthermal_Node8_MW/GCV
-        logger.debug(f"\tQSET requested from transmission Node 8 (m^3/s): {QSET_Node8:.2f}")
-        
         # Check for QSET limits
-        QSET_Node8 = CheckQLimit(QSET_Node8)
-        logger.debug(f"\tQSET available for transmission Node 8 (m^3/s): {QSET_Node8:.2f}")
-        
-        Pthermal_Node8_MW = GCV * QSET_Node8
-        
-        P_Node8_MW_new = CalculatePMW (Pthermal_Node8_MW, P_Node8_MW)
-        
+        QSET = CheckQLimit(QSET, gens.QMin, gens.QMax)
+        logger.debug("\tQSET available for transmission nodes %s (m^3/s): %s", gens.nodes, QSET)
+
+        P_MW_new = gens.available_power(P_MW, QSET)
+
         # Publish available active power in MW
-        fed.publications["ng1/node.8.avail"].publish(P_Node8_MW_new)
-        logger.debug(f"\tElectrical output power available for Node 8 " f"{P_Node8_MW_new:.2f}")
+        with timer.phase('publish'):
+            for pub, key, P in zip(pubs, avail_keys, P_MW_new):
+                pub.publish(float(P))
+                fedlog.value(ilog, grantedtime, key, P)
+        timer.count('publish', len(pubs))
 
     # Cleaning up HELICS stuff once we've finished the co-simulation.
     destroy_federate(fed)
-    
+    if timer.enabled:
+        timer.close()
+        logger.info("%d steps timed (%s), see %s", timer.steps, timer.summary(), timer.path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', help='federate JSON config, or a multi-federate file such as multi_site_config.json',
+                        default='SAInt_ng1_Config.json')
+    parser.add_argument('-g', '--generators', help='gas-fired generator configuration',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gas_generators.json'))
+    parser.add_argument('-e', '--end_time', help='simulation end time in seconds', default=10, type=int)
+    args = parser.parse_args()
+    fedlog.setup('ng1')
+
+    config = fedlog.load_federate_config('ng1', args.config)
+    if not config:
+        raise SystemExit(f'No ng1 federate config in {args.config}')
+    with open(args.generators, 'r') as f:
+        gen_config = json.load(f)
+    run_federate(config, gen_config, end_time=args.end_time)
+    h.helicsCloseLibrary()
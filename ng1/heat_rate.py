@@ -0,0 +1,185 @@
+# Heat-rate model of the gas-fired generators served by the gas federate
+
+import json
+
+import numpy as np
+
+# Every function works on arrays with one entry per generator. HR holds the
+# heat-rate coefficients as rows HR0 (MJ/kWh), HR1 ((MJ/kWh)/MW) and
+# HR2 ((MJ/kWh)/(MW*MW)), one column per generator, so that
+#     heat rate = HR0 + HR1*P + HR2*P*P    (MJ/kWh)
+#     Pthermal  = heat rate * P / 3.6      (MW)
+
+
+# Calculate thermal power from active power using heat rate
+def CalcPthermal(Pg, HR):
+    HR0, HR1, HR2 = HR
+    return ((HR2*Pg + HR1)*Pg + HR0)*Pg/3.6   # 3.6 is a MJ/kWh to MJ/MWh conversion factor
+
+
+# Check for gas off-take limits
+def CheckQLimit(QSet, QMin, QMax):
+    return np.clip(QSet, QMin, QMax)
+
+
+# Calculating the electrical output from the thermal power input iteratively
+def CalculatePMW(Y, X0, HR, tol=0.0001, max_iter=20):
+    """
+    Newton iteration for the active power X (MW) at which each generator
+    takes thermal power Y (MW), starting from X0. A generator stops
+    iterating once its heat input residual |3.6*Y - HR(X)*X| is within
+    `tol`; the others carry on, for at most `max_iter` iterations.
+    """
+    HR0, HR1, HR2 = HR
+    target = np.asarray(Y, dtype=float)*3.6
+    X_new = np.array(np.broadcast_to(X0, np.broadcast(target, HR0).shape), dtype=float)
+    for _ in range(max_iter):
+        delY = target - ((HR2*X_new + HR1)*X_new + HR0)*X_new
+        active = np.abs(delY) > tol
+        if not active.any():
+            break
+        delY_delX = -((3*HR2*X_new + 2*HR1)*X_new + HR0)
+        X_new = np.where(active, X_new - delY/delY_delX, X_new)
+    return X_new
+
+
+class InverseHeatRateTable:
+    """
+    Active power as a function of thermal power, tabulated at `points`
+    equally spaced thermal powers per generator between Pthermal(PMin)
+    and Pthermal(PMax) and interpolated linearly. The table is refined
+    (doubling its points, up to `max_points`) until the heat input
+    residual of the interpolated power is within `max_error` halfway
+    between table points, where the error of linear interpolation on a
+    smooth curve peaks. With `max_error` at or below the Newton tolerance,
+    a lookup already satisfies CalculatePMW and GasGenerators uses it
+    as the result for thermal powers the table covers.
+
+    The heat rate must make Pthermal increase monotonically over
+    [PMin, PMax] for the inverse to exist.
+    """
+
+    def __init__(self, HR, PMin, PMax, max_error=0.0001, points=64, max_points=1 << 16):
+        self.HR = np.asarray(HR, dtype=float)
+        self.PMin = np.asarray(PMin, dtype=float)
+        self.PMax = np.asarray(PMax, dtype=float)
+        self.max_error = max_error
+        HR = self.HR[:, :, None]
+        self.Y0 = CalcPthermal(self.PMin, self.HR)
+        self.Y1 = Y1 = CalcPthermal(self.PMax, self.HR)
+        while True:
+            grid = np.linspace(self.Y0, Y1, points, axis=1)
+            if np.any(np.diff(grid, axis=1) <= 0):
+                raise ValueError('thermal power must increase with active power between PMin and PMax')
+            X0 = np.linspace(self.PMin, self.PMax, points, axis=1)
+            X = CalculatePMW(grid, X0, HR, tol=max_error*1e-3, max_iter=50)
+            if np.any(np.diff(X, axis=1) <= 0):
+                raise ValueError('heat rate is not monotonic between PMin and PMax')
+            Ymid = (grid[:, 1:] + grid[:, :-1])/2
+            Xmid = (X[:, 1:] + X[:, :-1])/2
+            self.error = float(np.max(np.abs(3.6*(Ymid - CalcPthermal(Xmid, HR)))))
+            if self.error <= max_error:
+                break
+            if points*2 > max_points:
+                raise ValueError(f'inverse heat-rate table needs more than {max_points} points '
+                                 f'for an error of {max_error} (reached {self.error:.3g})')
+            points *= 2
+        self.points = points
+        self.dY = (Y1 - self.Y0)/(points - 1)
+        self.table = X
+        # Flat copies for lookups: point i of generator k is at k*points + i,
+        #   with the slope to the next point (repeated for the last one, so
+        #   the top of the table needs no special case)
+        self._inv_dY = 1/self.dY
+        self._offsets = np.arange(len(X))*points
+        self._flat = X.ravel()
+        slope = np.diff(X, axis=1)
+        self._slope = np.concatenate([slope, slope[:, -1:]], axis=1).ravel()
+
+    def lookup(self, Y):
+        """
+        Interpolated active power (MW) of every generator at thermal power
+        Y (MW), and a mask of the generators whose Y is outside the table,
+        which get PMin or PMax.
+        """
+        pos = (np.asarray(Y, dtype=float) - self.Y0)*self._inv_dY
+        last = self.points - 1
+        outside = None
+        if pos.min() < 0 or pos.max() > last:
+            outside = (pos < 0) | (pos > last)
+            pos = np.clip(pos, 0, last)
+        i = pos.astype(np.intp)
+        k = i + self._offsets
+        return self._flat.take(k) + self._slope.take(k)*(pos - i), outside
+
+    def __call__(self, Y):
+        """
+        Interpolated active power (MW) of every generator at thermal power
+        Y (MW), clamped to [PMin, PMax].
+        """
+        return self.lookup(Y)[0]
+
+
+class GasGenerators:
+    """
+    The gas-fired generators of a gas_generators.json file:
+
+        {"GCV": 39, "tolerance": 0.0001, "max_iter": 20,
+         "inverse_table": {"enabled": true, "max_error": 0.0001},
+         "generators": [{"node": 6, "HR": [20, -0.075, 0.001], "QMin": 0, "QMax": 1000, "PMax": 100}, ...]}
+
+    GCV is the gas calorific value (MJ/m^3), QMin/QMax the gas off-take
+    limits (m^3/s) and PMin (default 0)/PMax the range (MW) the inverse
+    heat-rate table covers.
+    """
+
+    def __init__(self, config):
+        generators = config['generators']
+        self.nodes = [int(g['node']) for g in generators]
+        self.HR = np.array([g['HR'] for g in generators], dtype=float).T
+        self.QMin = np.array([g.get('QMin', 0.0) for g in generators], dtype=float)
+        self.QMax = np.array([g.get('QMax', np.inf) for g in generators], dtype=float)
+        self.PMin = np.array([g.get('PMin', 0.0) for g in generators], dtype=float)
+        self.PMax = np.array([g.get('PMax', np.nan) for g in generators], dtype=float)
+        self.GCV = float(config.get('GCV', 39))
+        self.tolerance = float(config.get('tolerance', 0.0001))
+        self.max_iter = int(config.get('max_iter', 20))
+        self.inverse = None
+        table = config.get('inverse_table', {})
+        if table.get('enabled', False):
+            if np.isnan(self.PMax).any():
+                raise ValueError('every generator needs a PMax for the inverse heat-rate table')
+            self.inverse = InverseHeatRateTable(self.HR, self.PMin, self.PMax,
+                                                max_error=table.get('max_error', self.tolerance),
+                                                points=table.get('points', 64))
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def gas_offtake(self, P_MW):
+        """
+        Requested gas off-take (m^3/s) of the generators at active power P_MW.
+        """
+        return CalcPthermal(P_MW, self.HR)/self.GCV
+
+    def available_power(self, P_MW, QSet):
+        """
+        Active power (MW) the generators can deliver on gas off-take QSet
+        (m^3/s, already limited). With a table as accurate as the Newton
+        tolerance, its lookup is the result wherever it covers the thermal
+        power and Newton only runs for the other generators; a coarser
+        table only gives Newton its starting point. Without a table Newton
+        starts from the requested power P_MW.
+        """
+        Pthermal_MW = self.GCV*QSet
+        if self.inverse is None:
+            return CalculatePMW(Pthermal_MW, P_MW, self.HR, tol=self.tolerance, max_iter=self.max_iter)
+        X, outside = self.inverse.lookup(Pthermal_MW)
+        if self.inverse.max_error > self.tolerance:
+            return CalculatePMW(Pthermal_MW, X, self.HR, tol=self.tolerance, max_iter=self.max_iter)
+        if outside is not None:
+            X[outside] = CalculatePMW(Pthermal_MW[outside], X[outside], self.HR[:, outside],
+                                      tol=self.tolerance, max_iter=self.max_iter)
+        return X
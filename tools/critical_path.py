@@ -0,0 +1,226 @@
+"""
+Critical-path analysis of time grants across the federation.
+
+Merges the per-grant timing traces of the federates (results/<federate>/
+timing.csv, see common/timing.py) or HELICS profiler output (--profiler
+option of the broker/cores, "<PROFILING>...</PROFILING>" lines) onto the
+granted simulation time. For every simulation time granted to two or more
+federates it finds the federate that was last to request it, which held
+up the others, and how long each of the others had been waiting for it:
+the part of a federate's wait between its own request and the last one.
+Summed over the run this gives each federate's blame (seconds of other
+federates' waiting it caused) and its critical work (its own compute in
+the steps where it was last), the numbers to look at before optimizing a
+federate or moving it to a closer site.
+
+A federate granted the same time more than once (iterations, repeated
+requests) takes part in that grant with its last step only, the one after
+which the federation moved on; its earlier steps at that time still count
+in its grant, wait and work totals.
+
+Wall-clock times are compared across federates, so traces recorded on
+different hosts need synchronized clocks, or their offsets given with
+--offset.
+
+Sample call: python tools/critical_path.py                          (every trace in results/)
+             python tools/critical_path.py --profiler broker_profile.txt --grants grants.csv
+"""
+
+import os
+import re
+import csv
+import sys
+import argparse
+from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from recorder import RESULTS_DIR
+
+
+PROFILE_LINE = re.compile(
+    r'<PROFILING>(?P<name>.+?)\[(?P<id>\d+)\]\((?P<state>\w+)\)(?P<event>[^<]*)'
+    r'<(?P<steady>\d+)(?:\|(?P<wall>\d+))?>\[t=(?P<t>[^\]]+)\]</PROFILING>')
+
+
+class Step:
+    """
+    One grant of one federate: the request was made at `start` and granted
+    at `end` (epoch seconds); `work` is the federate's time between its
+    previous grant and this request.
+    """
+    __slots__ = ('federate', 'granted', 'start', 'end', 'wait', 'work')
+
+    def __init__(self, federate, granted, start, end, wait, work):
+        self.federate = federate
+        self.granted = granted
+        self.start = start
+        self.end = end
+        self.wait = wait
+        self.work = work
+
+
+def read_timing(path, federate):
+    """
+    Steps of a timing.csv written by common/timing.py.
+    """
+    steps = []
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            steps.append(Step(federate, float(row['granted']), float(row['request_start']), float(row['request_end']),
+                              float(row['wait']), float(row['read']) + float(row['compute']) + float(row['publish'])))
+    return steps
+
+
+def read_profiler(path):
+    """
+    Steps of every federate in a HELICS profiler file. Each "HELICS CODE
+    ENTRY" to "HELICS CODE EXIT" span in executing mode is a blocking call
+    (time request) granted at the EXIT's time; a federate's MARKER line
+    maps its steady clock to epoch time.
+    """
+    events = defaultdict(list)
+    offsets = {}
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            match = PROFILE_LINE.search(line)
+            if not match:
+                continue
+            name = match.group('name')
+            steady = int(match.group('steady')) * 1e-9
+            if match.group('wall'):
+                offsets.setdefault(name, int(match.group('wall')) * 1e-9 - steady)
+            events[name].append((match.group('event').strip(), match.group('state'), steady, float(match.group('t'))))
+    steps = {}
+    for name, entries in events.items():
+        offset = offsets.get(name, 0.0)
+        steps[name] = []
+        entry = None
+        last_exit = None
+        for event, state, steady, t in entries:
+            if event == 'HELICS CODE ENTRY':
+                entry = steady
+            elif event == 'HELICS CODE EXIT' and entry is not None:
+                if state == 'executing' and last_exit is not None:
+                    steps[name].append(Step(name, t, entry + offset, steady + offset,
+                                            steady - entry, entry - last_exit))
+                last_exit = steady
+                entry = None
+    return steps
+
+
+def find_traces(paths):
+    """
+    timing.csv files among `paths`, looking one level down in directories
+    that hold several runs (such as results/); keyed by federate
+    (directory) name.
+    """
+    traces = {}
+    for path in paths:
+        if os.path.isfile(path):
+            traces[os.path.basename(os.path.dirname(os.path.abspath(path)))] = path
+        elif os.path.isfile(os.path.join(path, 'timing.csv')):
+            traces[os.path.basename(os.path.abspath(path))] = os.path.join(path, 'timing.csv')
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.isfile(os.path.join(path, name, 'timing.csv')):
+                    traces[name] = os.path.join(path, name, 'timing.csv')
+    return traces
+
+
+def analyze(steps_by_federate):
+    """
+    Per-grant critical path of the merged traces.
+
+    :return: (grants, summary); grants is a list of dicts, one per
+        simulation time granted to two or more federates, summary a dict
+        of per-federate totals; only each federate's last step at a
+        granted time takes part in that grant
+    """
+    by_time = defaultdict(list)
+    summary = {}
+    for federate, steps in steps_by_federate.items():
+        summary[federate] = {'grants': len(steps), 'wait': sum(s.wait for s in steps),
+                             'work': sum(s.work for s in steps), 'last': 0, 'blame': 0.0, 'critical_work': 0.0}
+        for step in steps:
+            by_time[step.granted].append(step)
+
+    grants = []
+    for granted in sorted(by_time):
+        # A federate's last step at this time, the one it left the time with
+        last_steps = {}
+        for step in by_time[granted]:
+            if step.federate not in last_steps or step.end >= last_steps[step.federate].end:
+                last_steps[step.federate] = step
+        steps = list(last_steps.values())
+        if len(steps) < 2:
+            continue
+        last = max(steps, key=lambda s: s.start)
+        # Only the part of a wait after the federate's own request and before
+        #   the last request is due to the last federate
+        waits = {s.federate: min(s.wait, max(last.start - s.start, 0.0)) for s in steps if s is not last}
+        blame = sum(waits.values())
+        summary[last.federate]['last'] += 1
+        summary[last.federate]['blame'] += blame
+        summary[last.federate]['critical_work'] += last.work
+        grants.append({'granted': granted, 'last': last.federate, 'last_work': last.work,
+                       'spread': last.start - min(s.start for s in steps), 'blame': blame, 'waits': waits})
+    return grants, summary
+
+
+def report(grants, summary, top=10, out=sys.stdout):
+    federates = sorted(summary, key=lambda f: -summary[f]['blame'])
+    total_blame = sum(s['blame'] for s in summary.values()) or 1.0
+    out.write('%d shared grants across %d federates\n\n' % (len(grants), len(summary)))
+    out.write('%-28s %7s %7s %10s %10s %10s %7s %13s\n'
+              % ('federate', 'grants', 'last', 'wait (s)', 'work (s)', 'blame (s)', 'blame', 'critical (s)'))
+    for federate in federates:
+        s = summary[federate]
+        out.write('%-28s %7d %7d %10.3f %10.3f %10.3f %6.1f%% %13.3f\n'
+                  % (federate, s['grants'], s['last'], s['wait'], s['work'], s['blame'],
+                     100 * s['blame'] / total_blame, s['critical_work']))
+    if top and grants:
+        out.write('\nGrants with the most waiting:\n')
+        for grant in sorted(grants, key=lambda g: -g['blame'])[:top]:
+            out.write('  t=%-10g last %-24s %.3f s waited by %d federates, spread %.3f s\n'
+                      % (grant['granted'], grant['last'], grant['blame'], len(grant['waits']), grant['spread']))
+
+
+def write_grants(grants, federates, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['granted', 'last', 'last_work', 'spread', 'blame'] + ['wait.' + fed for fed in federates])
+        for grant in grants:
+            writer.writerow(['%g' % grant['granted'], grant['last'], '%.6f' % grant['last_work'],
+                             '%.6f' % grant['spread'], '%.6f' % grant['blame']]
+                            + ['%.6f' % grant['waits'][fed] if fed in grant['waits'] else '' for fed in federates])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('traces', help='timing.csv files, run directories, or directories of runs', nargs='*', default=None)
+    parser.add_argument('-p', '--profiler', help='HELICS profiler output file(s)', nargs='+', default=[])
+    parser.add_argument('--offset', help='clock offset of a federate in seconds, added to its wall times (e.g. ng1=-0.25)',
+                        action='append', default=[])
+    parser.add_argument('-g', '--grants', help='write the per-grant analysis to this CSV file', default=None)
+    parser.add_argument('-n', '--top', help='number of grants with the most waiting to list', default=10, type=int)
+    args = parser.parse_args()
+
+    steps_by_federate = {}
+    paths = args.traces if args.traces or args.profiler else [RESULTS_DIR]
+    for federate, path in find_traces(paths).items():
+        steps_by_federate[federate] = read_timing(path, federate)
+    for path in args.profiler:
+        steps_by_federate.update(read_profiler(path))
+    if not steps_by_federate:
+        raise SystemExit(f'No timing traces found in {", ".join(paths + args.profiler)}')
+
+    for item in args.offset:
+        federate, _, seconds = item.partition('=')
+        for step in steps_by_federate.get(federate, []):
+            step.start += float(seconds)
+            step.end += float(seconds)
+
+    grants, summary = analyze(steps_by_federate)
+    report(grants, summary, top=args.top)
+    if args.grants:
+        write_grants(grants, sorted(summary), args.grants)
@@ -0,0 +1,94 @@
+"""
+Renders the graphs of recorded federate runs (see common/recorder.py).
+
+Each run directory's meta.json lists its graphs under "plots":
+
+    {"file": "Node 2 Distribution.png", "xlabel": "simulation time (hr)",
+     "time_scale": 3600, "left": ["transmission/pcc.2.pnv"],
+     "right": ["distribution1/pcc.2.pq"], "left_label": "..."}
+
+"left"/"right" are the interfaces drawn on the left/right y-axis, which
+are labelled with "left_label"/"right_label" or else the label the
+interface was recorded with. Figures are rendered headless (Agg) in a
+process pool, so this can run on compute nodes after the federation has
+finished.
+
+Sample call: python tools/plot_results.py                    (every run in results/)
+             python tools/plot_results.py results/transmission -o figures
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+from recorder import Results, RESULTS_DIR
+
+
+def render(run_dir, plot, out_dir):
+    """
+    Draws one graph of the run in `run_dir` and returns the saved file.
+    """
+    results = Results(run_dir)
+    fig, ax1 = plt.subplots()
+    axes = [(ax1, 'left')]
+    if plot.get('right'):
+        axes.append((ax1.twinx(), 'right'))
+    for ax, side in axes:
+        names = plot.get(side, [])
+        for name in names:
+            t, v = results.series(name)
+            ax.plot(t / plot.get('time_scale', 1), v)
+        label = plot.get(side + '_label')
+        if label is None and names:
+            label = results.labels[names[-1]]
+        if label:
+            ax.set_ylabel(label)
+    ax1.set_xlabel(plot.get('xlabel', 'simulation time (s)'))
+    path = os.path.join(out_dir, plot['file'])
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def find_runs(paths):
+    """
+    Run directories among `paths`, looking one level down for directories
+    that hold several runs (such as results/).
+    """
+    runs = []
+    for path in paths:
+        if os.path.isfile(os.path.join(path, 'meta.json')):
+            runs.append(path)
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.isfile(os.path.join(path, name, 'meta.json')):
+                    runs.append(os.path.join(path, name))
+    return runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('runs', help='run directories, or directories of runs', nargs='*', default=[RESULTS_DIR])
+    parser.add_argument('-o', '--out', help='directory for the figures; default is each run directory', default=None)
+    parser.add_argument('-j', '--jobs', help='number of rendering processes', default=None, type=int)
+    args = parser.parse_args()
+
+    runs = find_runs(args.runs)
+    if not runs:
+        raise SystemExit(f'No recorded runs found in {", ".join(args.runs)}')
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = []
+        for run_dir in runs:
+            for plot in Results(run_dir).meta.get('plots', []):
+                futures.append(pool.submit(render, run_dir, plot, args.out or run_dir))
+        for future in futures:
+            print(future.result())
@@ -0,0 +1,157 @@
+"""
+Runs the Python federates in one process on the HELICS in-process core.
+
+Every federate is imported from its directory and its run_federate()
+runs on its own thread; they meet on an "inproc" broker created here, so
+there is no broker process, no process start-up per federate and no
+socket traffic. The federates' configs are their entries in
+multi_site_config.json with the core type overridden to "inproc" (see
+common/federation.py). The HELICS library is closed once, after every
+federate has finished. If a federate fails, the federation is stopped
+with a global error so the others do not wait for it forever. A federate
+none of whose subscriptions is published by another federate of the run
+would only ever read its defaults, so the run is refused before it starts;
+subscriptions left unconnected otherwise are listed.
+
+Logs and results go where the federates normally write them (logs/,
+results/<federate>/).
+
+Sample call: python tools/run_inproc.py                               (all federates)
+             python tools/run_inproc.py -f transmission ng1 ng2 --event_driven
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import importlib
+import threading
+
+import helics as h
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, 'common'))
+import fedlog
+import federation
+
+
+# federate -> (directory, module); each module has a run_federate(config, ...)
+FEDERATES = {
+    'transmission': ('transmission', 'transmission_dummy'),
+    'distribution2': ('distribution2', 'distribution'),
+    'distribution3': ('distribution3', 'demo_DSO'),
+    'ng1': ('ng1', 'SAInt_ng1'),
+    'ng2': ('ng2', 'ng2_dummy'),
+    'transportation2': ('transportation2', 'transportation2_dummy'),
+}
+
+
+def federate_arguments(name, module, args):
+    """
+    Arguments of run_federate() besides the config, as the federate's own
+    command line would set them.
+    """
+    if name == 'transmission':
+        return {'event_driven': args.event_driven}
+    if name == 'distribution2':
+        return {'dist': module.Distribution(iter=10, tol=1e-6)}
+    if name == 'distribution3':
+        with open(os.path.join(ROOT_DIR, 'transmission', 'matpowerwrapper_config.json'), 'r') as f:
+            return {'wrapper_config': json.load(f)}
+    if name == 'ng1':
+        with open(os.path.join(ROOT_DIR, 'ng1', 'gas_generators.json'), 'r') as f:
+            return {'gen_config': json.load(f), 'end_time': args.end_time}
+    return {'simEndTime': args.end_time, 'asyncTime': args.async_time}
+
+
+class FederateThread(threading.Thread):
+    """
+    Runs one federate's run_federate(); an exception ends the whole
+    federation through `broker`.
+    """
+
+    def __init__(self, name, run_federate, kwargs, broker):
+        super().__init__(name=name, daemon=True)
+        self.run_federate = run_federate
+        self.kwargs = kwargs
+        self.broker = broker
+        self.error = None
+        self.wall = None
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self.run_federate(**self.kwargs)
+        except Exception as e:
+            self.error = e
+            h.helicsBrokerGlobalError(self.broker, -1, f'federate {self.name} failed: {e}')
+        finally:
+            self.wall = time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', help='multi-federate config the federates\' entries are taken from',
+                        default=federation.DEFAULT_CONFIG)
+    parser.add_argument('-f', '--federates', help='federates to run', nargs='+', choices=list(FEDERATES),
+                        default=list(FEDERATES))
+    parser.add_argument('-e', '--end_time', help='simulation end time (s) of ng1, ng2 and transportation2', default=86400, type=int)
+    parser.add_argument('--event_driven', help='run transmission in event-driven mode', action='store_true')
+    parser.add_argument('-a', '--async_time', help='ng2 and transportation2 overlap computation with asynchronous time requests',
+                        action='store_true')
+    parser.add_argument('--timeout', help='seconds the federation may take', default=None, type=float)
+    args = parser.parse_args()
+
+    entries = federation.load_entries(args.config)
+    configs = {name: federation.federate_config(entries, name, 'inproc') for name in args.federates}
+    unconnected = federation.unconnected(configs.values())
+    idle = [name for name in args.federates if configs[name].get('subscriptions') and
+            len(unconnected[name]) == len(configs[name]['subscriptions'])]
+    for name in args.federates:
+        if unconnected[name] and name not in idle:
+            print('%s: no federate of this run publishes %s' % (name, ', '.join(unconnected[name])), file=sys.stderr)
+    if idle:
+        raise SystemExit('No federate of this run publishes any input of %s' % ', '.join(idle))
+
+    # The federates are imported here, one at a time, rather than on their
+    #   threads; ng2 and transportation2 share the first iohelper imported
+    #   (the two copies are the same)
+    threads = []
+    broker = h.helicsCreateBroker('inproc', 'inproc_broker', f'-f {len(args.federates)} --loglevel=warning')
+    for name in args.federates:
+        directory, module_name = FEDERATES[name]
+        sys.path.append(os.path.join(ROOT_DIR, directory))
+        module = importlib.import_module(module_name)
+        fedlog.setup(name)
+        kwargs = federate_arguments(name, module, args)
+        kwargs['config'] = configs[name]
+        threads.append(FederateThread(name, module.run_federate, kwargs, broker))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(None if args.timeout is None else max(args.timeout - (time.perf_counter() - start), 0))
+        if thread.is_alive():
+            h.helicsBrokerGlobalError(broker, -1, f'federation did not finish within {args.timeout} s')
+            break
+    wall = time.perf_counter() - start
+
+    failed = [thread for thread in threads if thread.error is not None or thread.is_alive()]
+    if not failed:
+        h.helicsBrokerWaitForDisconnect(broker, -1)
+    h.helicsBrokerFree(broker)
+    h.helicsCloseLibrary()
+
+    for thread in threads:
+        if thread.is_alive():
+            status = 'still running'
+        elif thread.error is not None:
+            status = f'failed: {thread.error!r}'
+        else:
+            status = 'done in %.3f s' % thread.wall
+        print('%-18s %s' % (thread.name, status))
+    print('%d federates in one process, %.3f s' % (len(threads), wall))
+    if failed:
+        raise SystemExit(1)
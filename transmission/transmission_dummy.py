@@ -8,18 +8,27 @@ Dummy federate for the transmission system model used in the HELICS+ capstone pr
 trevor.hardy@pnnl.gov
 """
 
-import matplotlib.pyplot as plt
+import numpy as np
 import helics as h
-import logging
-import pprint
+import os
+import sys
 import json
+import re
+import argparse
+from functools import partial
 
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.StreamHandler())
-logger.setLevel(logging.DEBUG)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'common'))
+import fedlog
+import timing
+import bidcodec
+from recorder import Recorder, RESULTS_DIR
 
-# Setting up pretty printing, mostly for debugging.
-pp = pprint.PrettyPrinter(indent=4)
+# Per-interface values go to the "interfaces" subsystem logger so they can
+#   be gated separately in multi_site_config.json. Handlers are only
+#   attached when run as a federate (fedlog.setup below), so importing the
+#   module does not start a log writer
+logger = fedlog.get_logger('transmission')
+ilog = fedlog.get_logger('transmission', 'interfaces')
 
 
 def destroy_federate(fed):
@@ -39,41 +48,278 @@ def destroy_federate(fed):
     grantedtime = h.helicsFederateRequestTime(fed, h.HELICS_TIME_MAXTIME)
     status = h.helicsFederateDisconnect(fed)
     h.helicsFederateFree(fed)
-    h.helicsCloseLibrary()
     logger.info("Federate finalized")
 
-def collect_data(data_list, idx, time, value):
-    data_list[idx][0].append(time)
-    data_list[idx][1].append(value)
-    return data_list
+class InterfaceRegistry:
+    """
+    Registry of the transmission federate's interfaces, built once from the
+    federate's JSON config. Every subscription is classified by its key and
+    paired with a publication: the one at the same index if it is of the
+    matching kind, as the configs list them in pairs, else the one for the
+    same bus/node. A publication is paired with one subscription at most.
+
+        <fed>/pcc.N.pq              (complex) -> pcc.N.pnv         distribution load
+        <fed>/pcc.N.rt_energy.bid   (JSON)    -> pcc.N.lmp         energy bid (JSON or binary, see bidcodec)
+        <fed>/node.N.avail          (double)  -> node.N.requested  natural gas
+
+    Per-interface state lives in typed NumPy arrays (one group of arrays per
+    kind) and each interface holds a pre-bound reader and publisher, so the
+    per-step work is a tight loop over HELICS calls plus one vectorized
+    update per kind.
+    """
+
+    # Defaults and nominal values assumed by the transmission model, keyed
+    # by subscription key. Interfaces not listed here use the "default" from
+    # the JSON config or the per-kind fallback below.
+    default_sub_values = {
+        'ng2/node.2.avail': 1000.0,
+        'ng2/node.3.avail': 1000.0,
+        'distribution1/pcc.2.pq': 21.7+12.7j,
+        'ng1/node.6.avail': 1000.0,
+        'ng1/node.8.avail': 1000.0,
+        'distribution2/pcc.9.pq': 29.5+16.6j,
+        'distribution3/pcc.13.pq': 13.5+5.8j,
+        'distribution3/pcc.13.rt_energy.bid': '{"constant_kW": 13.5, "constant_kVAR": 5.8, "P_bid": [100, 100], "Q_bid": [100, 100]}',
+        'distribution3_TE_agents/pcc.13.rt_energy.bid': '{"constant_kW": 13.5, "constant_kVAR": 5.8, "P_bid": [100, 100], "Q_bid": [100, 100]}',
+        'distribution4/pcc.14.pq': 14.9+5j,
+        'distribution5/pcc.11.pq': 3.5+1.8j,
+        'distribution5/pcc.12.pq': 6.1+1.6j,
+    }
+    fallback_values = {
+        'load': 10+5j,
+        'bid': '{"constant_kW": 13.5, "constant_kVAR": 5.8, "P_bid": [100, 100], "Q_bid": [100, 100]}',
+        'gas': 1000.0,
+    }
+
+    # Arbitrarily defined initial bus voltage, generator setpoint fuel
+    # consumption and energy price
+    initial_voltage = 100000.0+10000j
+    initial_mmbtu_using = 1000.0
+    initial_energy_price = 100
+
+    # Voltage impact factor minimizes change in voltage due to change in
+    # load to keep voltage impact reasonable
+    voltage_impact_factor = 0.5
+    price_impact_factor = 0.2
+
+    pattern = re.compile(r'(?:^|/)(pcc|node)\.(\d+)\.(pq|rt_energy\.bid|avail)$')
+    pub_pattern = re.compile(r'(?:^|/)(pcc|node)\.(\d+)\.(pnv|lmp|requested)$')
+    kinds = {'pq': 'load', 'rt_energy.bid': 'bid', 'avail': 'gas'}
+    pub_suffix = {'load': 'pnv', 'bid': 'lmp', 'gas': 'requested'}
+
+    def __init__(self, fed, config):
+        self.fed = fed
+        subs = {}
+        for i in range(0, fed.n_inputs):
+            sub = fed.get_subscription_by_index(i)
+            subs[sub.target] = (i, sub)
+        pubs = {}
+        pubs_by_index = {}
+        for i in range(0, fed.n_publications):
+            pub = fed.get_publication_by_index(i)
+            pubs[pub.name.split('/', 1)[-1]] = pub
+            pubs_by_index[i] = pub
+
+        groups = {'load': [], 'bid': [], 'gas': []}
+        paired = {}
+        for item in config.get('subscriptions', []):
+            match = self.pattern.search(item['key'])
+            if match is None or item['key'] not in subs:
+                logger.warning("\tUnrecognized subscription %s, ignoring", item['key'])
+                continue
+            prefix, number, suffix = match.groups()
+            kind = self.kinds[suffix]
+            idx, sub = subs[item['key']]
+            bus = int(number)
+            pub = self.pair(kind, pubs_by_index.get(idx), pubs.get(f'{prefix}.{number}.{self.pub_suffix[kind]}'))
+            if pub is not None and pub.name in paired:
+                logger.warning("\t%s and %s both pair with publication %s, %s will not be published",
+                               paired[pub.name], item['key'], pub.name, item['key'])
+                pub = None
+            elif pub is None:
+                logger.warning("\tNo publication paired with %s, it will not be published", item['key'])
+            else:
+                paired[pub.name] = item['key']
+                bus = int(self.pub_pattern.search(pub.name).group(2))
+                if bus != int(number):
+                    logger.warning("\t%s is paired by position with %s (bus %d)", item['key'], pub.name, bus)
+            default = self.default_sub_values.get(item['key'], item.get('default', self.fallback_values[kind]))
+            if kind == 'bid':
+                if not isinstance(default, str):
+                    default = json.dumps(default)
+            elif kind == 'load':
+                default = complex(str(default).replace(' ', ''))
+            else:
+                default = float(default)
+            groups[kind].append((idx, bus, item['key'], sub, pub, default))
+
+        self.load = self.build_group(groups['load'], h.helicsInputGetComplex, h.helicsPublicationPublishComplex, h.helicsInputSetDefaultComplex)
+        self.bid = self.build_group(groups['bid'], h.helicsInputGetString, h.helicsPublicationPublishDouble, h.helicsInputSetDefaultString)
+        self.gas = self.build_group(groups['gas'], h.helicsInputGetDouble, h.helicsPublicationPublishDouble, h.helicsInputSetDefaultDouble)
+        self.bid['read_bytes'] = [partial(h.helicsInputGetBytes, sub) for sub in self.bid['sub']]
+
+        # Subscription index -> (kind, position within the kind's arrays)
+        self.position = {}
+        for kind, group in (('load', self.load), ('bid', self.bid), ('gas', self.gas)):
+            for k, idx in enumerate(group['idx']):
+                self.position[int(idx)] = (kind, k)
+        self.updated_query = h.helicsCreateQuery(fed.name, "updated_input_indices")
+
+        # Typed per-kind state
+        self.nominal_load = np.array(self.load['default'], dtype=complex)
+        self.load_scaling = np.ones(len(self.nominal_load))
+        self.voltage_V = np.full(len(self.nominal_load), self.initial_voltage, dtype=complex)
+        self.mmbtu_using = np.full(len(self.gas['idx']), self.initial_mmbtu_using)
+        self.nominal_mmbtu_avail = np.array(self.gas['default'], dtype=float)
+        self.nominal_bid = [bidcodec.decode(b) for b in self.bid['default']]
+        self.past_bid = list(self.nominal_bid)
+        self.past_bid_hash = [None] * len(self.bid['idx'])
+        self.energy_price = np.full(len(self.bid['idx']), self.initial_energy_price, dtype=float)
+
+    @classmethod
+    def pair(cls, kind, by_index, by_name):
+        """
+        Publication paired with a subscription of `kind`: `by_index`, the one
+        at the subscription's index, if it is of that kind, else `by_name`,
+        the one named after the subscription's bus/node (None if neither).
+        """
+        if by_index is not None:
+            match = cls.pub_pattern.search(by_index.name)
+            if match is not None and match.group(3) == cls.pub_suffix[kind]:
+                return by_index
+        return by_name
+
+    @staticmethod
+    def build_group(entries, getter, publisher, set_default):
+        group = {
+            'idx': np.array([e[0] for e in entries], dtype=int),
+            'bus': np.array([e[1] for e in entries], dtype=int),
+            'key': [e[2] for e in entries],
+            'sub': [e[3] for e in entries],
+            'pub': [e[4] for e in entries],
+            'pub_name': [e[4].name if e[4] is not None else None for e in entries],
+            'default': [e[5] for e in entries],
+            'read': [partial(getter, e[3]) for e in entries],
+            'publish': [partial(publisher, e[4]) if e[4] is not None else None for e in entries],
+            'set_default': [partial(set_default, e[3]) for e in entries],
+        }
+        return group
+
+    def set_defaults(self):
+        for group in (self.load, self.bid, self.gas):
+            for key, set_default, val in zip(group['key'], group['set_default'], group['default']):
+                logger.info('\tdefault value for %s: %s', key, val)
+                set_default(val)
+
+    def updated_inputs(self):
+        """
+        Indices of the inputs updated since they were last read, from the
+        federate's local "updated_input_indices" query; falls back to
+        polling every input if the query is not answered.
+        """
+        try:
+            updated = h.helicsQueryExecute(self.updated_query, self.fed)
+        except h.HelicsException:
+            updated = None
+        if not isinstance(updated, list):
+            updated = [idx for idx, (kind, k) in self.position.items()
+                       if h.helicsInputIsUpdated(getattr(self, kind)['sub'][k])]
+        return updated
+
+    def select(self, updated=None):
+        """
+        Positions within each kind's arrays to process: all interfaces, or
+        only those whose subscription index is in `updated`.
+        """
+        if updated is None:
+            return {kind: np.arange(len(getattr(self, kind)['idx'])) for kind in ('load', 'bid', 'gas')}
+        selected = {'load': [], 'bid': [], 'gas': []}
+        for idx in updated:
+            if idx in self.position:
+                kind, k = self.position[idx]
+                selected[kind].append(k)
+        return {kind: np.array(sorted(ks), dtype=int) for kind, ks in selected.items()}
+
+    def read_loads(self, pos):
+        return np.fromiter((self.load['read'][k]() for k in pos), dtype=complex, count=len(pos))
+
+    def read_gas(self, pos):
+        return np.fromiter((self.gas['read'][k]() for k in pos), dtype=float, count=len(pos))
+
+    def read_bid(self, k):
+        """
+        Raw bid at position `k`: a JSON string, or the bytes of a binary
+        bid, whose string value stops at the NUL after its magic.
+        """
+        raw = self.bid['read'][k]()
+        if raw.startswith(bidcodec.MAGIC_TEXT):
+            raw = self.bid['read_bytes'][k]()
+        return raw
+
+    def update_voltages(self, loads, pos):
+        """
+        Scaling bus voltages due to change in load: the magnitude of the
+        difference between the nominal and provided load scales the nodal
+        voltage (increased load = decreased voltage) for all load buses in
+        `pos` at once.
+
+        :return: scaled load magnitudes
+        """
+        # Scaling loads so distribution load matches nominal load assumed
+        #   by transmission model
+        load_mag = np.abs(loads * self.load_scaling[pos])
+        nominal_mag = np.abs(self.nominal_load[pos])
+        load_scaling_factor = (load_mag - nominal_mag) / nominal_mag
+        self.voltage_V[pos] *= 1 - (self.voltage_impact_factor * load_scaling_factor)
+        return load_mag
+
+    def labels(self):
+        """
+        Graph labels and file names per subscription index.
+        """
+        labels = {}
+        for idx, bus in zip(self.load['idx'], self.load['bus']):
+            labels[idx] = (f'Bus {bus} voltage (V)', f'Bus {bus} load (MVA)', f'Node {bus} Distribution.png')
+        for idx, bus in zip(self.bid['idx'], self.bid['bus']):
+            labels[idx] = (f'Bus {bus} LMP ($/MWh)', f'Bus {bus} inflexible energy bid quantity (MWh)', f'Node {bus} Prices.png')
+        for idx, bus in zip(self.gas['idx'], self.gas['bus']):
+            labels[idx] = ('MMBtu using', 'MMBtu available', f'Node {bus} Natural Gas.png')
+        return labels
+
+
+def load_config(path):
+    """
+    Reads the federate JSON config; a multi-federate file such as
+    multi_site_config.json is searched for the "transmission" entry.
+    """
+    with open(path, 'r') as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = next(entry for entry in config if entry['name'] == 'transmission')
+    return config
 
-if __name__ == "__main__":
 
+def run_federate(config, event_driven=False):
+    """
+    Runs the transmission federate on `config` (its JSON config as a dict)
+    until the end of the simulated day. The HELICS library is left open
+    for the caller to close, as other federates may share the process.
+
+    :param event_driven: only process inputs updated since the last grant
+        and republish their outputs
+    """
     ##########  Registering  federate and configuring from JSON ################
-    fed = h.helicsCreateValueFederateFromConfig("transmission_config.json")
-    #logger.info(pp.pformat(fed))
-
-    logger.info(f"Created federate {fed.name}")
-    logger.debug(f"\tNumber of subscriptions: {fed.n_inputs}")
-    logger.debug(f"\tNumber of publications: {fed.n_publications}")
-
-    # Diagnostics to confirm JSON config correctly added the required
-    #   publications and subscriptions
-    subid = {}
-    pubid = {}
-    logger.info("Subscription details:")
-    #logger.info(pp.pformat(fed.subscriptions))
-    
-    for i in range(0, fed.n_inputs):
-        # logger.info(f"k: {k}")
-        # logger.info(f"v: {v}")
-        subid[i] = fed.get_subscription_by_index(i)
-        logger.debug(f"\tRegistered subscription---> {subid[i].target}")
-
-    for i in range(0, fed.n_publications):
-        pubid[i] = fed.get_publication_by_index(i)
-        #logger.info(pp.pformat(pubid[i]))
-        logger.debug(f"\tRegistered publication---> {pubid[i].name}")
+    fed = h.helicsCreateValueFederateFromConfig(json.dumps(config))
+    logger.info("Created federate %s", fed.name)
+    logger.debug("\tNumber of subscriptions: %d", fed.n_inputs)
+    logger.debug("\tNumber of publications: %d", fed.n_publications)
+
+    # Building the interface registry once; it also confirms the JSON
+    #   config correctly added the required publications and subscriptions
+    registry = InterfaceRegistry(fed, config)
+    for key, pub_name in zip(registry.load['key'] + registry.bid['key'] + registry.gas['key'],
+                             registry.load['pub_name'] + registry.bid['pub_name'] + registry.gas['pub_name']):
+        logger.debug("\tRegistered subscription---> %s (publishes %s)", key, pub_name)
         
         
 
@@ -86,164 +332,53 @@ if __name__ == "__main__":
     
 
     
-    # Data collection lists
-    pub_data = []
-    sub_data = []
-    for j in range(0, fed.n_publications):
-        pub_data.append([[],[]])
-        sub_data.append([[],[]])
-        
-    
-    # Assumes the subscriptions are in the following order:
-    #   0   ng2/node.2.avail
-    #   1   ng2/node.3.avail
-    #   2   distribution1/pcc.2.pq
-    #   3   ng1/node.6.avail
-    #   4   ng1/node.8.avail
-    #   5   distribution2/pcc.9.pq
-    #   6   distribution3/pcc.13.pq
-    #   7   distribution3_TE_agents/pcc.13.rt_energy.bid
-    #   8   distribution4/pcc.14.pq
-    #   9   distribution5/pcc.11.pq
-    #   10  distribution5/pcc.12.pq
-    
-    double_idx = [0, 1, 3, 4]
-    complex_idx = [2, 5, 6, 8, 9, 10]
-    json_idx = [7]
-    default_sub_values = [
-        1000.0,
-        1000.0,
-        21.7+12.7j,
-        1000.0,
-        1000.0,
-        29.5+16.6j,
-        13.5+5.8j,
-        '{"constant_kW": 13.5, "constant_kVAR": 5.8, "P_bid": [100, 100], "Q_bid": [100, 100]}',
-        14.9+5j,
-        3.5+1.8j,
-        6.1+1.6j
-    ]
-    
-    
-    # Scaling-factors for each subscription; not all subscriptions are for 
-    #   distribution loads
-    load_scaling = [
-        0,
-        0,
-        1,
-        0,
-        0,
-        1,
-        1,
-        0,
-        1,
-        1,
-        1]
-        
-    # Nominal load values for each bus (in subscription order):
-    nominal_load = [
-        0,
-        0,
-        21.7+12.7j,
-        0,
-        0,
-        29.5+16.6j,
-        13.5+5.8j,
-        0,
-        14.9+5j,
-        3.5+1.8j,
-        6.1+1.6j]
-        
-    nominal_bid = [
-        0,
-        0,
-        0,
-        0,
-        0,
-        0,
-        0,
-        {"constant_kW": 13.5, "constant_kVAR": 5.8, "P_bid": [100, 100], "Q_bid": [100, 100]},
-        0,
-        0,
-        0]
-        
-    # Arbitrarily defined initial bus voltages
-    voltage_V = [
-        0,
-        0,
-        100000.0+10000j,
-        0,
-        0,
-        100000.0+10000j,
-        100000.0+10000j,
-        0,
-        100000.0+10000j,
-        100000.0+10000j,
-        100000.0+10000j]
-        
-    # Arbitrarily defined initial generator setpoint fuel consumption
-    mmbtu_using = [
-        1000.0,
-        1000.0,
-        0,
-        1000.0,
-        1000.0,
-        0,
-        0,
-        0,
-        0,
-        0,
-        0]
-        
-    # Arbitrarily defined available MMBtu from ng federates
-    nominal_mmbtu_avail = [
-        1000.0,
-        1000.0,
-        0,
-        1000.0,
-        1000.0,
-        0,
-        0,
-        0,
-        0,
-        0,
-        0]
-        
-    # Arbitrarily defined initial energy price
-    energy_price = 100
+    # Recording every subscription and its paired publication; each
+    #   subscription index gets a graph of the two
+    # float64: the voltages follow the loads the feeders report and are not
+    #   bounded by anything the dummy checks
+    recorder = Recorder(os.path.join(RESULTS_DIR, 'transmission'), value_dtype='<f8', logger=logger)
+    plots = []
+    labels = registry.labels()
+    for group in (registry.load, registry.bid, registry.gas):
+        group['sub_id'] = []
+        group['pub_id'] = []
+        for idx, key, pub_name in zip(group['idx'], group['key'], group['pub_name']):
+            pub_label, sub_label, graph_file_name = labels[idx]
+            group['sub_id'].append(recorder.interface(key, sub_label))
+            group['pub_id'].append(recorder.interface(pub_name, pub_label) if pub_name else None)
+            plots.append({'file': graph_file_name, 'xlabel': 'simulation time (hr)', 'time_scale': 3600,
+                          'left': [pub_name] if pub_name else [], 'right': [key]})
+    recorder.meta['plots'] = plots
+
+    # Timing every grant; reads and publishes are timed through the
+    #   registry's bound callables
+    timer = timing.from_config('transmission', config['timing']) if 'timing' in config else timing.setup('transmission')
+    for group in (registry.load, registry.bid, registry.gas):
+        group['read'] = [timer.timed('read', read) for read in group['read']]
+        group['publish'] = [timer.timed('publish', publish) if publish is not None else None for publish in group['publish']]
+    registry.bid['read_bytes'] = [timer.timed('read', read) for read in registry.bid['read_bytes']]
     
     
     # Defining default values for the subscriptions by API since doing so is
     #   not supported via JSON config at the time of this writing.
     logger.info('Setting default values')
-    for idx, val in enumerate(default_sub_values):
-        logger.info(f'\tdefault value for {subid[idx].target}: {default_sub_values[idx]}')
-        #subid[i].set_default(default_sub_values[i])
-        if idx in double_idx:
-            h.helicsInputSetDefaultDouble(subid[idx], default_sub_values[idx])
-        elif idx in complex_idx:
-            h.helicsInputSetDefaultComplex(subid[idx], default_sub_values[idx])
-        elif idx in json_idx:
-            h.helicsInputSetDefaultString(subid[idx], default_sub_values[idx])
+    registry.set_defaults()
     
     granted_time = 0  
     
-    # keeping track of past bids to only update when a new value comes indent
-    past_bid = nominal_bid[7]
+    # Number of inputs processed and outputs published per grant
+    updates_per_grant = []
+    publications_per_grant = []
 
     ##############  Entering Execution Mode  ##################################
     fed.enter_executing_mode()
     logger.info("Entered HELICS execution mode")
     
     logger.info('Checking defaults for all subscriptions')
-    for idx in range(0, fed.n_inputs):
-        logger.info(f'\tsubscription: {subid[idx].target} (sub. index: {idx})')
-        if idx in double_idx:
-            logger.info(f'\t\tdouble default value: {subid[idx].double}')
-        elif idx in complex_idx:
-            logger.info(f'\t\tcomplex default value: {subid[idx].complex}')
-        elif idx in json_idx:
-            logger.info(f'\t\tcomplex default value: {pp.pformat(subid[idx].json)}')
+    for group in (registry.load, registry.bid, registry.gas):
+        for key, read in zip(group['key'], group['read']):
+            logger.info('\tsubscription: %s, default value: %s', key, read())
+    timer.start()
     
     
     # As long as granted time is in the time range to be simulated...   
@@ -251,148 +386,119 @@ if __name__ == "__main__":
 
         # Time request for the next physical interval to be simulated
         requested_time = total_interval
-        # logger.debug(f"Requesting time {requested_time}")
-        granted_time = fed.request_time(requested_time)
-        logger.debug(f'Granted time {granted_time} ({granted_time/3600} of {hours_of_sim} hours)')
+        granted_time = timer.request(fed.request_time, requested_time)
         hour = granted_time / 3600
+        logger.debug('Granted time %s (%s of %s hours)', granted_time, hour, hours_of_sim)
 
-        # Iterating over publications in this case since this example
-        #  uses only one charging voltage for all five batteries
+        # In event-driven mode only the inputs that changed are read and
+        #   only their paired outputs are republished
+        if event_driven:
+            updated = registry.updated_inputs()
+            selected = registry.select(updated)
+            logger.debug('\t%d of %d inputs updated', len(updated), fed.n_inputs)
+        else:
+            selected = registry.select()
+        n_published = 0
 
-            
-        for j in range(0, fed.n_subscriptions):
-            logger.info(f'\tProcessing subscription: {subid[j].target} (sub. index: {j})')
-            if nominal_load[j] != 0:
-                # Scaling loads so distribution load matches nominal load assumed 
-                #   by transmission model
-                scaled_load = subid[j].complex * load_scaling[j]
-                logger.info(f'\t\tscaled_load: {scaled_load}')
-                load_mag = abs(scaled_load)
-                sub_data = collect_data(sub_data, j, hour, load_mag)
-            
-                # Scaling bus voltage due to change in load
-                # Calculating the magnitude of difference between the nominal and 
-                #   provided load and scaling nodal voltage appropriately
-                #   (increase load = decreased voltage)
-                # Voltage impact factor minimizes change in voltage due to change in load
-                #   to keep voltage impact reasonable
-                voltage_impact_factor = 0.5
-                load_scaling_factor = (abs(scaled_load) - abs(nominal_load[j])) / abs(nominal_load[j])
-                voltage_impact_factor = 1 - (voltage_impact_factor * load_scaling_factor)
-                voltage_V[j] = voltage_V[j] * voltage_impact_factor
-                logger.info(f'\t\tload_scaling_factor: {load_scaling_factor}')
-                logger.info(f'\t\tvoltage_impact_factor: {voltage_impact_factor}')
-                logger.info(f'\t\tvoltage_V: {voltage_V[j]}')
+        # Distribution loads: one vectorized voltage update for all buses
+        pos = selected['load']
+        loads = registry.read_loads(pos)
+        load_mag = registry.update_voltages(loads, pos)
+        for m, k in enumerate(pos):
+            fedlog.value(ilog, granted_time, registry.load['key'][k], loads[m])
+            recorder.record(registry.load['sub_id'][k], granted_time, load_mag[m])
+            if registry.load['publish'][k] is not None:
                 # Pythonic API not working for me right now
                 # pubid[j].publish(voltage_V)
-                h.helicsPublicationPublishComplex(pubid[j], voltage_V[j])
-                logger.info(f'\t\tPublishing voltage_V: {voltage_V[j]}')
-                Vmag = abs(voltage_V[j])
-                pub_data = collect_data(pub_data, j, hour, Vmag)
-                
-            elif nominal_bid[j] != 0:
-                # Adjusting energy price (the publication next in order) based
-                #   on the same change in load
-                energy_bid_string = subid[j].string
-                energy_bid = json.loads(energy_bid_string)
-                logger.info(f'\t\tenergy_bid: {pp.pformat(energy_bid_string)}')
-                #Bid JSON looks like:
-                #{
-                #    "constant_kW": double,
-                #    "constant_kVAR": double,
-                #    "P_bid":[
-                #        double,
-                #        double,
-                #        ...
-                #   ],
-                #    "Q_bid":[
-                #        double,
-                #        double,
-                #        ...
-                #    ],
-                #}
-                if past_bid["constant_kW"] != energy_bid["constant_kW"]:
-                    logger.info("\t\tNew bid, update price")
-                    logger.info(f'\t\t\tcurrent energy_price: {energy_price}')
-                    past_bid = energy_bid
-                    sub_data = collect_data(sub_data, j, hour, energy_bid["constant_kW"])
-                    bid_scaling_factor = (energy_bid["constant_kW"] - nominal_bid[j]["constant_kW"]) / nominal_bid[j]["constant_kW"]
-                    price_impact_factor = 0.2
-                    energy_scaling_factor = bid_scaling_factor * price_impact_factor
-                    energy_price = energy_price * (1 + energy_scaling_factor)
-                    logger.info(f'\t\t\tbid_scaling_factor: {bid_scaling_factor}')
-                    logger.info(f'\t\t\tenergy_scaling_factor: {energy_scaling_factor}')
-                    logger.info(f'\t\t\tenergy_price: {energy_price}')
-                
+                registry.load['publish'][k](registry.voltage_V[k])
+                n_published += 1
+                fedlog.value(ilog, granted_time, registry.load['pub_name'][k], registry.voltage_V[k])
+                recorder.record(registry.load['pub_id'][k], granted_time, abs(registry.voltage_V[k]))
+
+        # Energy bids: adjusting energy price based on the change in load
+        for k in selected['bid']:
+            energy_bid_raw = registry.read_bid(k)
+            fedlog.value(ilog, granted_time, registry.bid['key'][k], energy_bid_raw)
+            # Only bids whose content changed are decoded
+            bid_hash = bidcodec.content_hash(energy_bid_raw)
+            if bid_hash == registry.past_bid_hash[k]:
+                ilog.debug('\tNo new bid for %s', registry.bid['key'][k])
+                continue
+            registry.past_bid_hash[k] = bid_hash
+            energy_bid = bidcodec.decode(energy_bid_raw)
+            #Bid JSON looks like:
+            #{
+            #    "constant_kW": double,
+            #    "constant_kVAR": double,
+            #    "P_bid":[
+            #        double,
+            #        double,
+            #        ...
+            #   ],
+            #    "Q_bid":[
+            #        double,
+            #        double,
+            #        ...
+            #    ],
+            #}
+            if registry.past_bid[k]["constant_kW"] != energy_bid["constant_kW"]:
+                old_price = registry.energy_price[k]
+                registry.past_bid[k] = energy_bid
+                recorder.record(registry.bid['sub_id'][k], granted_time, energy_bid["constant_kW"])
+                nominal_kW = registry.nominal_bid[k]["constant_kW"]
+                bid_scaling_factor = (energy_bid["constant_kW"] - nominal_kW) / nominal_kW
+                energy_scaling_factor = bid_scaling_factor * registry.price_impact_factor
+                registry.energy_price[k] = registry.energy_price[k] * (1 + energy_scaling_factor)
+                ilog.debug('\tNew bid for %s: bid_scaling_factor %s, energy_price %s -> %s',
+                           registry.bid['key'][k], bid_scaling_factor, old_price, registry.energy_price[k])
+            
+                if registry.bid['publish'][k] is not None:
                     # pubid[j].publish(energy_price)
-                    h.helicsPublicationPublishDouble(pubid[j], energy_price)
-                    logger.info(f'\t\tPublishing energy_price: {energy_price}')
-                    pub_data = collect_data(pub_data, j, hour, energy_price)
-                else:
-                    logger.info("\t\tNo new bid")
-                
-            elif nominal_mmbtu_avail[j] != 0:            
-                # Scaling all bus voltages due to change in generator output due to lack of fuel
-                mmbtu_avail = subid[j].double
-                sub_data = collect_data(sub_data, j, hour, mmbtu_avail)
-                logger.info(f'\t\tmmbtu_avail: {mmbtu_avail}')
-                mmbtu_using[j] = max(mmbtu_using[j], mmbtu_avail)
-                logger.info(f'\t\tmmbtu_using: {mmbtu_using[j]}')
+                    registry.bid['publish'][k](registry.energy_price[k])
+                    n_published += 1
+                    fedlog.value(ilog, granted_time, registry.bid['pub_name'][k], registry.energy_price[k])
+                    recorder.record(registry.bid['pub_id'][k], granted_time, registry.energy_price[k])
+            else:
+                ilog.debug('\tNo new bid for %s', registry.bid['key'][k])
+
+        # Natural gas: generator fuel use follows the available MMBtu
+        pos = selected['gas']
+        mmbtu_avail = registry.read_gas(pos)
+        registry.mmbtu_using[pos] = np.maximum(registry.mmbtu_using[pos], mmbtu_avail)
+        for m, k in enumerate(pos):
+            recorder.record(registry.gas['sub_id'][k], granted_time, mmbtu_avail[m])
+            fedlog.value(ilog, granted_time, registry.gas['key'][k], mmbtu_avail[m])
+            if registry.gas['publish'][k] is not None:
                 # Pythonic API not working for me right now
                 # pubid[j].publish(mmbtu_using)
-                h.helicsPublicationPublishDouble(pubid[j], mmbtu_using[j])
-                logger.info(f'\t\tPublishing mmbtu_using: {mmbtu_using[j]}')
-                pub_data = collect_data(pub_data, j, hour, mmbtu_using[j])
+                registry.gas['publish'][k](registry.mmbtu_using[k])
+                n_published += 1
+                fedlog.value(ilog, granted_time, registry.gas['pub_name'][k], registry.mmbtu_using[k])
+                recorder.record(registry.gas['pub_id'][k], granted_time, registry.mmbtu_using[k])
+
+        updates_per_grant.append(len(selected['load']) + len(selected['bid']) + len(selected['gas']))
+        publications_per_grant.append(n_published)
             
     destroy_federate(fed)
+    recorder.close()
+    logger.info('Recorded %d samples to %s', recorder.rows, recorder.path)
+    if timer.enabled:
+        timer.close()
+        logger.info('%d steps timed (%s), see %s', timer.steps, timer.summary(), timer.path)
 
+    if updates_per_grant:
+        logger.info('Processed %d inputs and published %d outputs over %d grants (%.1f inputs per grant)',
+                    sum(updates_per_grant), sum(publications_per_grant), len(updates_per_grant), np.mean(updates_per_grant))
 
-    logger.info('Making graphs')
-    # Printing out final results graphs for comparison/diagnostic purposes.
-    pub_labels = [  'MMBtu using', 
-                    'MMBtu using', 
-                    'Bus 2 voltage (V)', 
-                    'MMBtu using', 
-                    'MMBtu using',
-                    'Bus 9 voltage (V)',
-                    'Bus 13 voltage (V)',
-                    'Bus 13 LMP ($/MWh)',
-                    'Bus 14 voltage (V)',
-                    'Bus 11 voltage (V)',
-                    'Bus 12 voltage (V)']
-    sub_labels = [  'MMBtu available', 
-                    'MMBtu available', 
-                    'Bus 2 load (MVA)', 
-                    'MMBtu available', 
-                    'MMBtu available',
-                    'Bus 9 load (MVA)',
-                    'Bus 13 load (MVA)',
-                    'Bus 13 inflexible energy bid quantity (MWh)',
-                    'Bus 14 load (MVA)',
-                    'Bus 11 load (MVA)',
-                    'Bus 12 load (MVA)']
-    graph_file_names = [
-                    'Node 2 Natural Gas.png',
-                    'Node 3 Natural Gas.png',
-                    'Node 2 Distribution.png',
-                    'Node 6 Natural Gas.png',
-                    'Node 8 Natural Gas.png',
-                    'Node 9 Distribution.png',
-                    'Node 13 Distribution.png',
-                    'Node 13 Prices.png',
-                    'Node 14 Distribution.png',
-                    'Node 11 Distribution.png',
-                    'Node 12 Distribution.png']
-   
-   
-    for j in range(0, fed.n_publications):
-        fig, ax1 = plt.subplots()
-        ax1.plot(pub_data[j][0], pub_data[j][1])
-        ax2 = ax1.twinx()
-        ax2.plot(sub_data[j][0], sub_data[j][1])
-        ax1.set_xlabel('simulation time (hr)')
-        ax1.set_ylabel(pub_labels[j])
-        ax2.set_ylabel(sub_labels[j])
-        plt.show()
-        plt.savefig(graph_file_names[j])
-        
+    logger.info('Graphs can be rendered with tools/plot_results.py %s', recorder.path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', help='federate JSON config, or a multi-federate file such as multi_site_config.json', default='transmission_config.json')
+    parser.add_argument('-e', '--event_driven', help='only process inputs updated since the last grant and republish their outputs', action='store_true')
+    args = parser.parse_args()
+    fedlog.setup('transmission')
+
+    run_federate(load_config(args.config), event_driven=args.event_driven)
+    h.helicsCloseLibrary()
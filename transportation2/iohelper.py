@@ -1,11 +1,19 @@
 import uuid
 import json
+from functools import partial
+from contextlib import nullcontext
 from collections import OrderedDict, defaultdict
 
+import numpy as np
 import helics as h
 
 
 class IOHelper(object):
+	# Set to True to overlap local computation with time requests, see request_time
+	async_time=False
+	precomputed=None
+	# Optional common/timing.py StepTimer recording where each step's time goes
+	timer=None
 
 #=======================================================================================================================
 	def create_federate(self,config):
@@ -14,42 +22,178 @@ class IOHelper(object):
 #=======================================================================================================================
 	def enter_execution_mode(self):
 		self.federate.enter_executing_mode()
+		if self.timer:
+			self.timer.start()
 
 #=======================================================================================================================
 	def setup_publications(self,config):
+		"""Binds a publish callable to every publication once. self.pubKeys
+		lists the keys in config order, which is the interface index used
+		by publish_all."""
 		self.pub=pub={}
+		self.pubKeys=[]
 		if 'publications' in config:
 			for index,item in zip(range(h.helicsFederateGetPublicationCount(self.federate)),config['publications']):
 				indexObj=h.helicsFederateGetPublicationByIndex(self.federate,index)
-				thisPub=pub[h.helicsPublicationGetKey(indexObj)]={}
+				key=h.helicsPublicationGetName(indexObj)
+				thisPub=pub[key]={}
 				thisPub['indexObj']=indexObj
-				if item['type']=='bool':
-					thisPub['method']='helicsPublicationPublishBoolean'
-				elif item['type']=='double':
-					thisPub['method']='helicsPublicationPublishDouble'
-				elif item['type']=='string':
-					thisPub['method']='helicsPublicationPublishString'
+				thisPub['index']=index
+				thisPub['type']=self._type_name(item['type'])
+				thisPub['publish']=self._bind_publish(indexObj,thisPub['type'])
+				self.pubKeys.append(key)
+		self._publishers=[pub[key]['publish'] for key in self.pubKeys]
 
 #=======================================================================================================================
 	def setup_subscriptions(self,config):
+		"""Binds a read callable to every subscription once. self.subKeys
+		lists the subscribed keys in config order, which is the interface
+		index used by read_updated."""
 		self.sub=sub={}
+		self.subKeys=[]
 		if 'subscriptions' in config:
 			for index,item in zip(range(h.helicsFederateGetInputCount(self.federate)),config['subscriptions']):
 				indexObj=h.helicsFederateGetInputByIndex(self.federate,index)
-				thisSub=sub[h.helicsInputGetKey(indexObj)]={}
+				thisSub=sub[h.helicsInputGetName(indexObj)]={}
 				thisSub['indexObj']=indexObj
+				thisSub['index']=index
 				thisSub['key']=item['key']
-				if item['type']=='bool':
-					thisSub['method']='helicsInputGetBoolean'
-				elif item['type']=='double':
-					thisSub['method']='helicsInputGetDouble'
-				elif item['type']=='string':
-					thisSub['method']='helicsInputGetString'
+				thisSub['type']=self._type_name(item['type'])
+				thisSub['read']=self._bind_read(indexObj,thisSub['type'])
+				self.subKeys.append(item['key'])
+		self._inputs=[(thisSub['indexObj'],thisSub['read']) for thisSub in sorted(sub.values(),key=lambda x:x['index'])]
+		self.subValues=[None]*len(self._inputs)
+
+#=======================================================================================================================
+	# HELICS type names and aliases accepted in configs
+	typeAliases={'bool':'bool','boolean':'bool','double':'double','int':'integer','integer':'integer',
+		'string':'string','complex':'complex','vector':'vector','double_vector':'vector',
+		'complex vector':'complex_vector','complex_vector':'complex_vector','json':'json'}
+
+	@classmethod
+	def _type_name(cls,typeName):
+		try:
+			return cls.typeAliases[typeName.lower()]
+		except KeyError:
+			raise ValueError('unsupported interface type {}, expected one of {}'.format(typeName,sorted(cls.typeAliases)))
+
+	@staticmethod
+	def _bind_publish(indexObj,typeName):
+		if typeName=='bool':
+			return partial(h.helicsPublicationPublishBoolean,indexObj)
+		elif typeName=='double':
+			return partial(h.helicsPublicationPublishDouble,indexObj)
+		elif typeName=='integer':
+			return lambda val:h.helicsPublicationPublishInteger(indexObj,int(val))
+		elif typeName=='string':
+			return partial(h.helicsPublicationPublishString,indexObj)
+		elif typeName=='complex':
+			return lambda val:h.helicsPublicationPublishComplex(indexObj,val.real,val.imag)
+		elif typeName=='vector':
+			return lambda val:h.helicsPublicationPublishVector(indexObj,[float(x) for x in val])
+		elif typeName=='complex_vector':
+			return lambda val:h.helicsPublicationPublishComplexVector(indexObj,[complex(x) for x in val])
+		elif typeName=='json':
+			return lambda val:h.helicsPublicationPublishString(indexObj,json.dumps(val))
+
+	@staticmethod
+	def _bind_read(indexObj,typeName):
+		if typeName=='bool':
+			return partial(h.helicsInputGetBoolean,indexObj)
+		elif typeName=='double':
+			return partial(h.helicsInputGetDouble,indexObj)
+		elif typeName=='integer':
+			return partial(h.helicsInputGetInteger,indexObj)
+		elif typeName=='string':
+			return partial(h.helicsInputGetString,indexObj)
+		elif typeName=='complex':
+			return partial(h.helicsInputGetComplex,indexObj)
+		elif typeName=='vector':
+			return partial(h.helicsInputGetVector,indexObj)
+		elif typeName=='complex_vector':
+			# helicsInputGetComplexVector pads its result with as many values
+			# again; the vector size counts the real and imaginary parts
+			return lambda:h.helicsInputGetComplexVector(indexObj)[:h.helicsInputGetVectorSize(indexObj)//2]
+		elif typeName=='json':
+			return lambda:json.loads(h.helicsInputGetString(indexObj) or 'null')
+
+#=======================================================================================================================
+	def publish_all(self,values):
+		"""Publishes values[i] on publication i (order of self.pubKeys)."""
+		if len(values)!=len(self._publishers):
+			raise ValueError('expected {} values, got {}'.format(len(self._publishers),len(values)))
+		with self._phase('publish'):
+			for publish,val in zip(self._publishers,values):
+				publish(val)
+		if self.timer:
+			self.timer.count('publish',len(values))
+
+#=======================================================================================================================
+	def read_updated(self):
+		"""Reads the inputs updated since they were last read. Returns an
+		array of their indices (order of self.subKeys) and a list of their
+		values; self.subValues keeps the latest value of every input."""
+		updated=[]
+		values=[]
+		with self._phase('read'):
+			for index,(indexObj,read) in enumerate(self._inputs):
+				if h.helicsInputIsUpdated(indexObj):
+					val=self.subValues[index]=read()
+					updated.append(index)
+					values.append(val)
+		if self.timer:
+			self.timer.count('read',len(updated))
+		return np.array(updated,dtype=np.intp),values
+
+#=======================================================================================================================
+	def request_time(self,requestedTime,precompute=None):
+		"""Requests requestedTime and returns the granted time.
+
+		precompute(requestedTime) prepares the step that follows the grant
+		(profiles, bid curves, surrogate lookups, ...); its return value is
+		left in self.precomputed. With async_time the request goes out with
+		helicsFederateRequestTimeAsync and precompute runs while the grant
+		is in flight, hiding the federation's grant latency; otherwise it
+		runs just before a blocking request. Both modes compute the same
+		thing, only the overlap differs.
+
+		Contract for precompute while the request is outstanding:
+		* no HELICS calls on this federate: no publishing, no input reads,
+		  no queries or property/time calls (the federate is mid-request)
+		* it only sees data from before the grant; anything received at the
+		  new time must be read after request_time returns
+		* it may read and update the federate's own state (config, models,
+		  caches) as long as the code after the grant expects that
+		* exceptions are raised after the pending grant has completed"""
+		timer=self.timer
+		if not self.async_time:
+			with self._phase('compute'):
+				self.precomputed=precompute(requestedTime) if precompute else None
+			if timer:
+				timer.begin_request(requestedTime)
+			grantedTime=h.helicsFederateRequestTime(self.federate,requestedTime)
+		else:
+			if timer:
+				timer.begin_request(requestedTime)
+			h.helicsFederateRequestTimeAsync(self.federate,requestedTime)
+			try:
+				with self._phase('compute'):
+					self.precomputed=precompute(requestedTime) if precompute else None
+			finally:
+				grantedTime=h.helicsFederateRequestTimeComplete(self.federate)
+		if timer:
+			timer.end_request(grantedTime)
+		return grantedTime
+
+#=======================================================================================================================
+	def _phase(self,name):
+		return self.timer.phase(name) if self.timer else nullcontext()
 
 #=======================================================================================================================
 	def finalize(self):
+		"""Frees the federate. The HELICS library is left open for the
+		process to close once all its federates are done."""
 		h.helicsFederateFree(self.federate)
-		h.helicsCloseLibrary()
 
 #=======================================================================================================================
 	def start_broker(self,nFeds):
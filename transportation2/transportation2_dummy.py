@@ -1,23 +1,21 @@
 import os
+import sys
 import json
 import argparse
-import logging
 
+import numpy as np
 import helics as h
 
 from iohelper import IOHelper
 
-
 baseDir=os.path.dirname(os.path.abspath(__file__))
-formatterStr='%(asctime)s::%(name)s::%(filename)s::%(funcName)s::'+\
-	'%(levelname)s::%(message)s::%(threadName)s::%(process)d'
-formatter = logging.Formatter(formatterStr)
-fh = logging.FileHandler(os.path.join(baseDir,'logs','transportation2.log'),mode='w')
-fh.setFormatter(formatter)
-fh.setLevel(10)
-logger = logging.getLogger('transportation2_logger')
-logger.setLevel(10)
-logger.addHandler(fh)
+sys.path.append(os.path.join(os.path.dirname(baseDir),'common'))
+import fedlog
+import timing
+
+# Handlers are only attached when run as a federate (fedlog.setup below), so
+#   importing the module does not start a log writer
+logger=fedlog.get_logger('transportation2')
 
 
 class NGFederate(IOHelper):
@@ -33,6 +31,7 @@ class NGFederate(IOHelper):
 		self.create_federate(json.dumps(config))
 		self.setup_publications(config)
 		self.setup_subscriptions(config)
+		self.pubData=np.zeros(len(self.pubKeys))
 		logger.info('completed init')
 
 #=======================================================================================================================
@@ -41,21 +40,43 @@ class NGFederate(IOHelper):
 		logger.info('entered execution mode')
 
 		grantedTime=0
+		pubData=self.run(grantedTime)
 		while grantedTime<simEndTime:
 			# sub
-			for entry in self.sub:
-				if h.helicsInputIsUpdated(self.sub[entry]['indexObj']):
-					val=h.__dict__[self.sub[entry]['method']](self.sub[entry]['indexObj'])
-
-			# run
-			pubData={self.config['name']+'/'+entry['key']:1 for entry in self.config['publications']}
+			updated,values=self.read_updated()
 
 			# publish
-			for entry in self.pub:
-				h.__dict__[self.pub[entry]['method']](self.pub[entry]['indexObj'],pubData[entry])
+			self.publish_all(pubData)
+
+			# the next step's outputs are computed while the grant is pending
+			grantedTime=self.request_time(grantedTime+self.dt,precompute=self.run)
+			pubData=self.precomputed
+			logger.info('grantedTime::::%s',grantedTime)
 
-			grantedTime=h.helicsFederateRequestTime(self.federate,grantedTime+self.dt)
-			logger.info(f'grantedTime::::{grantedTime}')
+#=======================================================================================================================
+	def run(self,simTime):
+		"""Outputs to publish at simTime, one per publication in the order
+		of self.pubKeys. Runs while the request for simTime may still be
+		pending, so it must not touch HELICS (see IOHelper.request_time)."""
+		self.pubData[:]=1
+		return self.pubData
+
+#=======================================================================================================================
+def run_federate(config,simEndTime=86400,asyncTime=False,startBroker=False):
+	"""Runs the federate on config (its JSON config as a dict) until
+	simEndTime. The HELICS library is left open for the caller to close, as
+	other federates may share the process."""
+	thisFed=NGFederate(config)
+	thisFed.async_time=asyncTime
+	thisFed.timer=timing.from_config('transportation2',config.get('timing',{}))
+	if startBroker:
+		thisFed.start_broker(1)
+	thisFed.initialize()
+	thisFed.simulate(simEndTime=simEndTime)
+	thisFed.finalize()
+	if thisFed.timer.enabled:
+		thisFed.timer.close()
+		logger.info('%d steps timed (%s), see %s',thisFed.timer.steps,thisFed.timer.summary(),thisFed.timer.path)
 
 #=======================================================================================================================
 if __name__=='__main__':
@@ -63,25 +84,22 @@ if __name__=='__main__':
 	parser=argparse.ArgumentParser()
 	parser.add_argument('-b','--start_broker',help='start broker',default=False)
 	parser.add_argument('-s','--standalone',help='standalone test',default=False)
+	parser.add_argument('-c','--config',help='multi-federate config (default multi_site_config.json)',default=None)
 	parser.add_argument('-e','--end_time',help='simulation end time',default=86400,type=int)
+	parser.add_argument('-a','--async_time',help='overlap computation with asynchronous time requests',action='store_true')
 	args=parser.parse_args()
+	fedlog.setup('transportation2',log_file=os.path.join(baseDir,'logs','transportation2.log'),console=False)
 
 	if args.standalone:
 		args.start_broker=True
 		baseDir=os.path.dirname(os.path.abspath(__file__))
 		config=json.load(open(os.path.join(baseDir,'config_standalone.json')))
 	else:
-		baseDir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-		mainConfig=json.load(open(os.path.join(baseDir,'multi_site_config.json')))
-		for entry in mainConfig:
-			if entry['name']=='transportation2':
-				config=entry
+		config=fedlog.load_federate_config('transportation2',args.config)
+		if not config:
+			raise SystemExit('No transportation2 entry in {}'.format(args.config or fedlog.DEFAULT_CONFIG))
 
-	thisFed=NGFederate(config)
-	if args.start_broker:
-		thisFed.start_broker(1)
-	thisFed.initialize()
-	thisFed.simulate(simEndTime=args.end_time)
-	thisFed.finalize()
+	run_federate(config,simEndTime=args.end_time,asyncTime=args.async_time,startBroker=args.start_broker)
+	h.helicsCloseLibrary()
 
 